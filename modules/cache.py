@@ -0,0 +1,120 @@
+import hashlib
+import os
+import pickle
+
+from modules.classes import Dat
+from modules.datfile import DAT_FILE_ERRORS, open_dat_file
+from modules.importdata import get_clone_list_file, get_metadata_file
+from modules.utils import Font, printwrap
+
+# Bump this when DatTitle or DatNode change, so old caches aren't loaded
+CACHE_VERSION = '3'
+CACHE_FOLDER = 'cache'
+
+
+def hash_file(file_name, hash_object=None):
+    """ Returns a hash of a file's contents, or None if the file doesn't exist """
+
+    if hash_object == None:
+        hash_object = hashlib.sha256()
+
+    if os.path.isfile(file_name) == False:
+        return None
+
+    with open(file_name, 'rb') as input_file:
+        for chunk in iter(lambda: input_file.read(1048576), b''):
+            hash_object.update(chunk)
+
+    return hash_object.hexdigest()
+
+
+def cache_file_name(dat_file, region_data):
+    """ Returns the cache file name for a dat, keyed by a hash of the dat, the
+    internal config, and the region list the dat's titles were split by
+    """
+
+    cache_key = hashlib.sha256(CACHE_VERSION.encode('utf-8'))
+
+    # The dat might be compressed, so hash its decompressed contents
+    with open_dat_file(dat_file, 'rb') as input_file:
+        for chunk in iter(lambda: input_file.read(1048576), b''):
+            cache_key.update(chunk)
+
+    hash_file('internal-config.json', cache_key)
+    cache_key.update('|'.join(region_data.all).encode('utf-8'))
+
+    return os.path.join(CACHE_FOLDER, f'{cache_key.hexdigest()}.cache')
+
+
+def dependencies(input_dat):
+    """ Returns hashes of the clone list and metadata files used by a dat """
+
+    clone_file = get_clone_list_file(input_dat)
+    metadata_file = get_metadata_file(input_dat.name)
+
+    return {
+        clone_file: hash_file(clone_file),
+        metadata_file: hash_file(metadata_file)
+    }
+
+
+def read_cache(dat_file, region_data):
+    """ Returns a Dat object from the cache if the dat, internal config, clone list
+    and metadata file haven't changed since it was cached. Otherwise returns None.
+    """
+
+    try:
+        cache_file = cache_file_name(dat_file, region_data)
+    except DAT_FILE_ERRORS:
+        return None
+
+    if os.path.isfile(cache_file) == False:
+        return None
+
+    try:
+        with open(cache_file, 'rb') as input_file:
+            cached_dat = pickle.load(input_file)
+    except (OSError, EOFError, pickle.UnpicklingError, AttributeError, ImportError):
+        return None
+
+    input_dat = Dat(**cached_dat['details'])
+    del input_dat.contents
+
+    if dependencies(input_dat) != cached_dat['dependencies']:
+        return None
+
+    input_dat.titles = cached_dat['titles']
+    input_dat.clone_lists = cached_dat['clone_lists']
+
+    return input_dat
+
+
+def write_cache(dat_file, input_dat, region_data):
+    """ Writes a Dat object's details, title records and clone lists to the cache """
+
+    cache_file = cache_file_name(dat_file, region_data)
+
+    cached_dat = {
+        'details': {
+            'name': input_dat.name,
+            'description': input_dat.description,
+            'version': input_dat.version,
+            'author': input_dat.author,
+            'url': input_dat.url,
+        },
+        'dependencies': dependencies(input_dat),
+        'titles': input_dat.titles,
+        'clone_lists': input_dat.clone_lists,
+    }
+
+    try:
+        os.makedirs(CACHE_FOLDER, exist_ok=True)
+
+        with open(cache_file + '.tmp', 'wb') as output_file:
+            pickle.dump(cached_dat, output_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(cache_file + '.tmp', cache_file)
+    except OSError as e:
+        printwrap(
+            f'{Font.warning}* Couldn\'t write the cache file: {str(e)}{Font.end}',
+            'error')
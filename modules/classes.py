@@ -1,8 +1,10 @@
+import copy
 import re
+import sys
 
-from modules.titleutils import get_languages, get_raw_title, remove_languages,\
-    remove_regions, remove_tags
-from modules.utils import Font
+from modules.titleutils import check_date, get_languages, get_raw_title,\
+    get_region_bits, remove_languages, remove_regions, remove_tags
+from modules.utils import Font, hash_to_bytes, hash_to_text, required_text
 
 class CloneList:
     """ Returns a formatted clone list """
@@ -27,12 +29,33 @@ class Dat:
         self.user_options = user_options
 
 
+class DatTitle:
+    """ Returns a compact record of a title as read from the input dat """
+
+    __slots__ = ('name', 'category', 'description', 'roms', 'disk', 'nodes')
+
+    def __init__(self, name, category, description, roms, disk=False):
+        self.name = name
+        self.category = sys.intern(category)
+        self.description = description
+        self.roms = roms
+        self.disk = disk
+        self.nodes = {}
+
+
 class DatNode:
     """ Returns an object that contains all of a title's properties """
 
+    __slots__ = (
+        'full_name', 'secondary_name', 'status', 'online_languages', 'version',
+        'disc_type', 'disc_type_parent', 'tag_free_name', 'region_free_name',
+        'short_name', 'title_languages', 'group', 'implied_language', 'regions',
+        'primary_region', 'region_priority', 'secondary_region', 'category',
+        'description', 'cloneof', 'cloneof_group', 'languages', 'roms', 'features')
+
     def __init__(self, node, region, region_data, user_input, input_dat, REGEX):
 
-        self.full_name = str(node.description.parent['name'])
+        self.full_name = node.name
 
         metadata = input_dat.metadata
 
@@ -53,19 +76,20 @@ class DatNode:
         # Set title with minimal tags, starting with normalizing disc names
         tag_free_name = self.full_name
 
-        for key, value in user_input.tag_strings.disc_rename.items():
-            if key in tag_free_name:
-                tag_free_name = tag_free_name.replace(key, value)
+        if user_input.tag_strings.disc_rename_pattern.search(tag_free_name) != None:
+            for key, value in user_input.tag_strings.disc_rename.items():
+                if key in tag_free_name:
+                    tag_free_name = tag_free_name.replace(key, value)
 
         # Strip out other tags found in tags.json
         self.tag_free_name = remove_tags(tag_free_name, user_input, REGEX)
 
         # Set region free, language free title
-        if re.search(' \((.*?,){0,} {0,}' + region + '(,.*?){0,}\)', self.full_name) != None:
-            self.region_free_name = remove_regions(remove_languages(self.full_name, REGEX.languages), region_data)
+        if REGEX.patterns.region_tag(region).search(self.full_name) != None:
+            self.region_free_name = remove_regions(remove_languages(self.full_name, REGEX.languages), region_data, REGEX)
 
             # Now set regionless title with minimal tags
-            self.short_name = remove_regions(remove_languages(self.tag_free_name, REGEX.languages), region_data)
+            self.short_name = remove_regions(remove_languages(self.tag_free_name, REGEX.languages), region_data, REGEX)
         else:
             self.region_free_name = self.full_name
             self.short_name = self.tag_free_name
@@ -77,16 +101,16 @@ class DatNode:
         if region != 'Unknown':
             self.implied_language = region_data.implied_language[region]
 
-            self.regions = re.search('\((.*?,){0,} {0,}' + region + '(,.*?){0,}\)', self.full_name)[0][1:-1]
+            self.regions = REGEX.patterns.region(region).search(self.full_name)[0][1:-1]
 
             for another_region in region_data.all:
-                if re.search(' \(' + another_region + '(,.*?){0,}\)', self.full_name) != None:
-                    self.primary_region = another_region
-                    break
+                if (
+                    ' (' + another_region in self.full_name
+                    and REGEX.patterns.primary_region(another_region).search(self.full_name) != None):
+                        self.primary_region = another_region
+                        break
 
-            for i, x in enumerate(region_data.all):
-                if self.primary_region == x:
-                    self.region_priority = i
+            self.region_priority = region_data.priority[self.primary_region]
         else:
             self.implied_language = ''
             self.regions = 'Unknown'
@@ -98,11 +122,8 @@ class DatNode:
         else:
             self.secondary_region = ''
 
-        if node.category is None:
-            self.category = ''
-        else:
-            self.category = node.category.contents[0]
-        self.description = node.description.contents[0]
+        self.category = node.category
+        self.description = node.description
         self.cloneof = ''
         self.cloneof_group = ''
 
@@ -113,35 +134,21 @@ class DatNode:
             self.languages = self.implied_language
         elif self.online_languages == '' and self.title_languages != '':
             if '+' in self.title_languages:
-                self.title_languages = self.title_languages.replace('+', ',')
-                new_title_languages = self.title_languages.split(',')
-                new_title_languages = set(new_title_languages)
-                self.title_languages = ','.join(new_title_languages)
+                self.title_languages = ','.join(REGEX.languages.languages(self.title_languages))
 
             self.languages = self.title_languages
 
-        # Convert the <rom> lines for the current node
-        node_roms = node.findChildren('rom', recursive=False)
-        roms = []
-        for rom in node_roms:
-            if 'crc' not in (str(rom)):
-                crc_string = ''
-            else:
-                crc_string = rom['crc']
+        # Share the strings that are repeated across many titles
+        self.regions = sys.intern(self.regions)
+        self.secondary_region = sys.intern(self.secondary_region)
+        self.title_languages = sys.intern(self.title_languages)
+        self.online_languages = sys.intern(self.online_languages)
+        self.languages = sys.intern(self.languages)
 
-            if 'md5' not in (str(rom)):
-                md5_string = ''
-            else:
-                md5_string = rom['md5']
+        self.roms = node.roms
 
-            if 'sha1' not in (str(rom)):
-                sha1_string = ''
-            else:
-                sha1_string = rom['sha1']
-
-            roms.append(DatNodeRom('rom', crc_string, md5_string, rom['name'], sha1_string, rom['size']))
-
-        self.roms = roms
+        # Set by dat_to_dict with the title's TitleFeatures, before parents are chosen
+        self.features = None
 
         if self.full_name not in metadata:
             # Calculate total disc size
@@ -198,29 +205,143 @@ class DatNode:
         ret_str.append(f'  └ roms ┐\n')
         for i, rom in enumerate(self.roms):
             if i == len(self.roms) - 1:
-                ret_str.append(f'         └ name: {rom.name} | crc: {rom.crc} | md5: {rom.md5} | sha1: {rom.sha1} | size: {rom.size}\n\n')
+                ret_str.append(f'         └ name: {rom.name} | crc: {hash_to_text(rom.crc)} | md5: {hash_to_text(rom.md5)} | sha1: {hash_to_text(rom.sha1)} | size: {rom.size}\n\n')
             else:
-                ret_str.append(f'         ├ name: {rom.name} | crc: {rom.crc} | md5: {rom.md5} | sha1: {rom.sha1} | size: {rom.size}\n')
+                ret_str.append(f'         ├ name: {rom.name} | crc: {hash_to_text(rom.crc)} | md5: {hash_to_text(rom.md5)} | sha1: {hash_to_text(rom.sha1)} | size: {rom.size}\n')
 
         ret_str = ''.join(ret_str)
         return ret_str
 
 
 class DatNodeRom:
-    """ Returns an object that contains a title's rom properties """
+    """ Returns an object that contains a title's rom properties
+
+    Hashes are stored as bytes and sizes as ints. Use hash_to_text to get a hash
+    back in the dat's format.
+    """
+
+    __slots__ = ('crc', 'md5', 'name', 'sha1', 'size')
 
     def __init__(self, rom, crc, md5, name, sha1, size):
-        self.crc = crc.lower()
-        self.md5 = md5.lower()
+        self.crc = hash_to_bytes(crc)
+        self.md5 = hash_to_bytes(md5)
         self.name = name
-        self.sha1 = sha1.lower()
-        self.size = size
+        self.sha1 = hash_to_bytes(sha1)
+
+        # Only store sizes as ints if they're written back the same way
+        if (
+            size != None
+            and size.isascii() == True
+            and size.isdigit() == True
+            and str(int(size)) == size):
+                self.size = int(size)
+        else:
+            self.size = size
+
+
+class FrozenDict(dict):
+    """ A dict that raises a TypeError if it's changed once it's built
+
+    Unlike types.MappingProxyType, it can be pickled, so it can be sent to worker
+    processes that are spawned rather than forked.
+    """
+
+    def read_only(self, *args, **kwargs):
+        raise TypeError('The runtime shared by every dat file can\'t be changed')
+
+    __setitem__ = __delitem__ = __ior__ = read_only
+    clear = pop = popitem = setdefault = update = read_only
+
+    def __reduce__(self):
+        return (FrozenDict, (dict(self),))
+
+
+class LanguageTags:
+    """ Finds and parses the language tag in a title, like (En,Fr,De) or (En+Fr)
+
+    A tag is the first one in the title that starts with a known language code, or
+    two codes joined by a +. Codes that are plain text are looked up in a set. The
+    rest, like En(-[A-Z][A-Z]){,1}, are checked against codes with the same prefix
+    the first time they're seen, and remembered after that.
+    """
+
+    def __init__(self, languages_short):
+        self.codes = {}
+        self.code_patterns = {}
+
+        for language in languages_short:
+            if re.fullmatch('[A-Za-z]+', language) != None:
+                self.codes[language] = True
+            else:
+                prefix = re.match('[A-Za-z]*', language)[0]
+
+                if prefix not in self.code_patterns:
+                    self.code_patterns[prefix] = []
+                self.code_patterns[prefix].append(re.compile(language))
+
+    def is_code(self, code):
+        """ Returns whether a string is a known language code """
+
+        if code not in self.codes:
+            self.codes[code] = False
+
+            for pattern in self.code_patterns.get(re.match('[A-Za-z]*', code)[0], []):
+                if pattern.fullmatch(code) != None:
+                    self.codes[code] = True
+                    break
+
+        return self.codes[code]
+
+    def is_language(self, element):
+        """ Returns whether the first element of a tag is a language code, or two
+        language codes joined by a +
+        """
+
+        if self.is_code(element) == True:
+            return True
+
+        if element.count('+') == 1:
+            first, second = element.split('+')
+            return self.is_code(first) == True and self.is_code(second) == True
+
+        return False
+
+    def find(self, title):
+        """ Returns a title's language tag including the space before it, or None if
+        the title doesn't have one
+        """
+
+        start = title.find(' (')
+
+        while start != -1:
+            end = title.find(')', start)
+
+            if end == -1:
+                return None
+
+            element = title[start + 2:end].split(',', 1)[0]
+
+            if (
+                self.is_language(element) == True
+                or self.is_language(element.rstrip('.')) == True):
+                    return title[start:end + 1]
+
+            start = title.find(' (', start + 1)
+
+        return None
+
+    def languages(self, tag):
+        """ Returns the language codes in a tag's contents in order, without
+        duplicates
+        """
+
+        return list(dict.fromkeys(tag.replace('+', ',').split(',')))
 
 
 class Regex:
     """ Regex constructor """
 
-    def __init__(self, LANGUAGES):
+    def __init__(self, languages_short):
         # Preproduction
         self.alpha = re.compile('\(Alpha( [0-9]{,2}){,1}\)')
         self.beta = re.compile('\(Beta( [0-9]{,2}){,1}\)')
@@ -235,7 +356,7 @@ class Regex:
         self.dates = re.compile('\((\d{8}|\d{4}-\d{2}-\d{2}|\d{2}-\d{2}-\d{4}|\d{2}-\d{2}-\d{2})\)')
         self.dates_whitespace = re.compile('\s?\((\d{8}|\d{4}-\d{2}-\d{2}|\d{2}-\d{2}-\d{4}|\d{2}-\d{2}-\d{2})\)\s?')
         self.edc = re.compile('\(EDC\)')
-        self.languages = re.compile('( (\((' + LANGUAGES + ')\.*?)(,.*?\)|\)))')
+        self.languages = LanguageTags(languages_short)
         self.oem = re.compile('\((?:(?!\(|OEM.*?)[\s\S])*OEM.*?\)')
         self.hibaihin = re.compile('\(Hibaihin.*?\)')
         self.pirate = re.compile('\(Pirate\)')
@@ -287,6 +408,130 @@ class Regex:
         self.gamecube_virtual_console = '\((?:(?!\(|.*?GameCube.*?)[\s\S])*?GameCube.*?\)'
         self.virtual_console = '\(Virtual Console\)'
 
+        # The tags TitleFeatures finds in titles, with the text each needs so a tag
+        # can be ruled out without running its regex
+        self.version_tags = [
+            (string, required_text(string.pattern), string) for string in [
+                self.version,
+                self.long_version,
+                self.fds_version,
+                self.revision,
+                self.beta,
+                self.alpha,
+                self.proto]]
+
+        self.feature_tags = [
+            (string, required_text(string if isinstance(string, str) else string.pattern), re.compile(string))
+            for string in [
+                self.switch_online,
+                self.wii_virtual_console,
+                self.threeds_virtual_console,
+                self.gamecube_virtual_console,
+                self.virtual_console,
+                self.alt,
+                self.oem,
+                self.bad,
+                self.hibaihin,
+                self.covermount,
+                self.rerelease,
+                self.edc,
+                self.sega_ring_code,
+                self.dates]]
+
+
+class Patterns:
+    """ A registry of precompiled region and language patterns
+
+    Patterns for every region, the full region list, and every implied language
+    are compiled once per run. Anything else is compiled the first time it's asked
+    for. Lookups are counted as hits, and patterns that had to be compiled on the
+    fly as misses, so code that builds a new pattern for every title shows up.
+    """
+
+    def __init__(self, region_data):
+        self.compiled = {}
+        self.hits = 0
+        self.misses = 0
+        self.language_bits = region_data.language_bits
+        self.language_masks = {}
+
+        for language in region_data.languages_short:
+            self.compiled[language] = re.compile(language)
+
+        for region in region_data.all:
+            for pattern in [
+                '\((.*?,){0,} {0,}' + region + '(,.*?){0,}\)',
+                ' \((.*?,){0,} {0,}' + region + '(,.*?){0,}\)',
+                ' \(' + region + '(,.*?){0,}\)']:
+                    self.compiled[pattern] = re.compile(pattern)
+
+            if region_data.implied_language[region] != '':
+                self.compiled[region_data.implied_language[region]] = re.compile(
+                    region_data.implied_language[region])
+
+        region_list = ' \(((.*?,){0,} {0,})(' + '|'.join(region_data.all) + ').*?\)'
+        self.compiled[region_list] = re.compile(region_list)
+
+    def get(self, pattern):
+        """ Returns a compiled pattern, compiling it if it hasn't been seen before """
+
+        compiled = self.compiled.get(pattern)
+
+        if compiled != None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            compiled = self.compiled[pattern] = re.compile(pattern)
+
+        return compiled
+
+    def region(self, region):
+        """ Matches a region anywhere in a title's region tag """
+
+        return self.get('\((.*?,){0,} {0,}' + region + '(,.*?){0,}\)')
+
+    def region_tag(self, region):
+        """ Matches a region anywhere in a title's region tag, including the space
+        before it
+        """
+
+        return self.get(' \((.*?,){0,} {0,}' + region + '(,.*?){0,}\)')
+
+    def primary_region(self, region):
+        """ Matches a region at the start of a title's region tag """
+
+        return self.get(' \(' + region + '(,.*?){0,}\)')
+
+    def region_list(self, regions):
+        """ Matches a region tag that contains any of a list of regions """
+
+        return self.get(' \(((.*?,){0,} {0,})(' + '|'.join(regions) + ').*?\)')
+
+    def language(self, language):
+        """ Matches a language code in a title's languages """
+
+        return self.get(language)
+
+    def languages(self, languages):
+        """ Returns a bitmask of the languages matched in a title's languages
+
+        Titles share a small number of language strings, so each string's bitmask
+        is only worked out once.
+        """
+
+        language_mask = self.language_masks.get(languages)
+
+        if language_mask == None:
+            language_mask = 0
+
+            for language, bit in self.language_bits.items():
+                if self.language(language).search(languages) != None:
+                    language_mask |= bit
+
+            self.language_masks[languages] = language_mask
+
+        return language_mask
+
 
 class RegionKeys():
     """ Region keys constructor """
@@ -295,6 +540,8 @@ class RegionKeys():
         self.filename = 'internal-config.json'
         self.region_order = 'default_region_order'
         self.languages = 'languages'
+        self.aliases = 'region_aliases'
+        self.region_languages = 'region_languages'
 
 
 class Regions():
@@ -308,6 +555,10 @@ class Regions():
         self.languages_long = []
         self.languages_short = []
         self.languages_key = {}
+        self.aliases = {}
+        self.priority = {}
+        self.language_bits = {}
+        self.region_languages = {}
 
     def __str__(self):
         ret_str = []
@@ -328,19 +579,61 @@ class Regions():
         return ret_str
 
 
+class Runtime:
+    """ The state that's built once per run and shared by every dat file and worker
+    process: the region data, the user's input and options, and the compiled
+    regexes and pattern registry
+
+    The region lists and rank tables are frozen when the runtime is built, so a dat
+    file or worker can't change them for the others. The tag strings aren't frozen,
+    and must only be read. The pattern registry keeps adding the patterns it
+    compiles, which doesn't change what they match.
+    """
+
+    __slots__ = ('region_data', 'user_input', 'REGEX')
+
+    def __init__(self, region_data, user_input, REGEX):
+        region_data.all = tuple(region_data.all)
+        region_data.implied_language = FrozenDict(region_data.implied_language)
+        region_data.priority = FrozenDict(region_data.priority)
+        user_input.user_region_order = tuple(user_input.user_region_order)
+        user_input.region_ranks = FrozenDict(user_input.region_ranks)
+
+        self.region_data = region_data
+        self.user_input = user_input
+        self.REGEX = REGEX
+
+    def for_dat(self):
+        """ Returns a copy of the runtime for a single dat file to change
+
+        Only the user input that processing a dat file changes is copied. The frozen
+        region data, compiled regexes and tag strings are shared.
+        """
+
+        user_input = copy.copy(self.user_input)
+        user_input.removed_titles = {}
+
+        return Runtime(self.region_data, user_input, self.REGEX)
+
+
 class Stats():
     """ Stores stats before processing the dat """
 
     def __init__(self, original_title_count, user_input, input_dat, final_title_count=0):
         def category_count(category):
-            """ Gets the category count from the soup object """
+            """ Gets the category count from the dat's title records """
 
             if hasattr(user_input, 'no_' + category.lower()):
                 if getattr(user_input, 'no_' + category.lower()) == True:
-                    return len(input_dat.soup.find_all('category', string=category))
+                    return len([x for x in input_dat.titles if x.category == category])
                 else:
                     return 0
 
+        def description_count(string):
+            """ Gets the count of titles with a string in their description """
+
+            return len([x for x in input_dat.titles if string in x.description])
+
         self.original_title_count = original_title_count
         self.final_title_count = final_title_count
         self.applications_count = category_count('Applications')
@@ -351,25 +644,25 @@ class Stats():
         self.preproduction_count = category_count('Preproduction')
 
         if user_input.no_unlicensed == True:
-            self.unlicensed_count = len(input_dat.soup.find_all('description', string=lambda x: x and '(Unl)' in x))
+            self.unlicensed_count = description_count('(Unl)')
         else:
             self.unlicensed_count = 0
 
         if user_input.no_bad_dumps == True:
-            self.bad_dump_count = len(input_dat.soup.find_all('description', string=lambda x: x and '[b]' in x))
+            self.bad_dump_count = description_count('[b]')
         else:
             self.bad_dump_count = 0
 
         if user_input.no_pirate == True:
-            self.pirate_count = len(input_dat.soup.find_all('description', string=lambda x: x and '(Pirate)' in x))
+            self.pirate_count = description_count('(Pirate)')
         else:
             self.pirate_count = 0
 
         if user_input.no_promotional == True:
             self.promotional_count = (
-                len(input_dat.soup.find_all('description', string=lambda x: x and '(Promo)' in x))
-                + len(input_dat.soup.find_all('description', string=lambda x: x and 'EPK' in x))
-                + len(input_dat.soup.find_all('description', string=lambda x: x and 'Press Kit' in x))
+                description_count('(Promo)')
+                + description_count('EPK')
+                + description_count('Press Kit')
                 )
         else:
             self.promotional_count = 0
@@ -392,7 +685,10 @@ class Tags:
     def __init__(self):
         self.demote_editions = set()
         self.disc_rename = {}
+        self.disc_rename_pattern = None
+        self.edition_patterns = []
         self.ignore = set()
+        self.ignore_patterns = []
         self.promote_editions = set()
 
     def __str__(self):
@@ -417,6 +713,60 @@ class Tags:
         return ret_str
 
 
+class TitleFeatures:
+    """ Returns the tags parent selection compares in a title, found once so the
+    choose_* functions don't have to search the title for each comparison
+    """
+
+    __slots__ = (
+        'bios', 'preproduction', 'tags', 'versions', 'ring_code', 'date', 'regions',
+        'primary_rank', 'secondary_rank', 'languages')
+
+    def __init__(self, title, REGEX, user_input):
+        self.bios = '[BIOS]' in title.full_name
+        self.preproduction = re.search(REGEX.preproduction_long, title.full_name) != None
+
+        # The tags and editions found in the title's full name
+        self.tags = set()
+
+        # The version and revision tags found in the title's region free name
+        self.versions = {}
+
+        for string, text, pattern in REGEX.version_tags:
+            if text in title.full_name and pattern.search(title.full_name) != None:
+                self.tags.add(string)
+
+            if text in title.region_free_name:
+                version = pattern.search(title.region_free_name)
+
+                if version != None:
+                    self.versions[string] = version[0]
+
+        for string, text, pattern in REGEX.feature_tags + user_input.tag_strings.edition_patterns:
+            if text in title.full_name and pattern.search(title.full_name) != None:
+                self.tags.add(string)
+
+        if REGEX.sega_ring_code in self.tags:
+            self.ring_code = re.search(REGEX.sega_ring_code, title.full_name)[0]
+        else:
+            self.ring_code = None
+
+        if REGEX.dates in self.tags:
+            self.date = check_date(REGEX.dates, title.full_name)
+        else:
+            self.date = None
+
+        # The title's regions as a bitset of their ranks in the user's region order,
+        # so the highest bit is the title's highest priority region
+        self.regions = get_region_bits(title.regions, user_input.region_ranks)
+        self.primary_rank = user_input.region_ranks.get(title.primary_region, 0)
+        self.secondary_rank = get_region_bits(
+            title.secondary_region, user_input.region_ranks).bit_length()
+
+        # The title's languages as a bitmask
+        self.languages = REGEX.patterns.languages(title.languages)
+
+
 class Titles:
     """ Tag keys constructor """
 
@@ -435,7 +785,7 @@ class UserInput:
                  no_promotional, no_unlicensed,
                  supersets, filter_languages, legacy,
                  user_options, verbose, keep_remove,
-                 use_cache):
+                 use_cache, jobs):
         self.input_file_name = input_file_name
         self.output_folder_name = output_folder_name
 
@@ -456,4 +806,5 @@ class UserInput:
         self.user_options = user_options
         self.verbose = verbose
         self.keep_remove = keep_remove
-        self.use_cache = use_cache
\ No newline at end of file
+        self.use_cache = use_cache
+        self.jobs = jobs
\ No newline at end of file
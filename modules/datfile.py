@@ -0,0 +1,170 @@
+import bz2
+import glob
+import gzip
+import io
+import locale
+import lzma
+import mmap
+import os
+import re
+import zipfile
+
+# Compressed dat formats that are decompressed as they're read
+COMPRESSED_EXTENSIONS = {
+    '.gz': gzip.open,
+    '.xz': lzma.open,
+    '.lzma': lzma.open,
+    '.bz2': bz2.open,
+}
+
+# Errors that can be raised when opening or reading a dat file
+DAT_FILE_ERRORS = (OSError, EOFError, zipfile.BadZipFile, lzma.LZMAError)
+
+
+def is_dat_file(file_name):
+    """ Returns whether a file name is a dat file, or a compressed dat file """
+
+    file_name = file_name.lower()
+
+    for extension in COMPRESSED_EXTENSIONS:
+        if file_name.endswith(extension):
+            file_name = file_name[:-len(extension)]
+            break
+
+    return file_name.endswith('.dat')
+
+
+def zip_dat_files(zip_file):
+    """ Returns the paths of the dat files inside a zip file """
+
+    with zipfile.ZipFile(zip_file) as archive:
+        return [
+            os.path.join(zip_file, member.filename) for member in archive.infolist()
+            if member.is_dir() == False and is_dat_file(member.filename) == True]
+
+
+def find_dat_files(input_file_name):
+    """ Returns a list of the dat files to process and whether they're a batch
+
+    Folders are searched for plain and compressed dat files, and zip files. Zip
+    files are expanded to the dat files they contain, and a zip file that holds
+    more than one dat file is treated like a folder.
+    """
+
+    if os.path.isdir(input_file_name) == True:
+        dat_files = []
+
+        for file_name in glob.glob(os.path.abspath(input_file_name) + '/*'):
+            if file_name.lower().endswith('.zip'):
+                try:
+                    dat_files.extend(zip_dat_files(file_name))
+                except DAT_FILE_ERRORS:
+                    # Let the error be reported when the file is processed
+                    dat_files.append(file_name)
+            elif is_dat_file(file_name) == True:
+                dat_files.append(file_name)
+
+        return dat_files, True
+
+    if zipfile.is_zipfile(input_file_name) == True:
+        dat_files = zip_dat_files(input_file_name)
+
+        if len(dat_files) > 1:
+            return dat_files, True
+
+    return [input_file_name], False
+
+
+def split_zip_path(dat_file):
+    """ Returns the zip file and member name of a dat file stored in a zip file
+
+    Returns None if the dat file isn't in a zip file.
+    """
+
+    if os.path.isfile(dat_file) == True:
+        if zipfile.is_zipfile(dat_file) == True:
+            dat_files = zip_dat_files(dat_file)
+
+            if dat_files == []:
+                raise OSError(f'No dat files found in "{dat_file}"')
+
+            return dat_file, os.path.relpath(dat_files[0], dat_file).replace(os.sep, '/')
+        return None
+
+    zip_path = re.search('^(.*?\.zip)[\\\\/](.+)$', dat_file, flags=re.I)
+
+    if zip_path != None:
+        return zip_path.group(1), zip_path.group(2).replace(os.sep, '/')
+
+    return None
+
+
+def dat_file_size(dat_file):
+    """ Returns the size of a dat file in bytes
+
+    Dat files in zip files return their uncompressed size, and other compressed
+    dat files their compressed size. Returns 0 if the file can't be read, so it's
+    reported as an error when it's processed.
+    """
+
+    try:
+        zip_path = split_zip_path(dat_file)
+
+        if zip_path != None:
+            with zipfile.ZipFile(zip_path[0]) as archive:
+                return archive.getinfo(zip_path[1]).file_size
+
+        return os.path.getsize(dat_file)
+    except DAT_FILE_ERRORS + (KeyError,):
+        return 0
+
+
+def open_dat_file(dat_file, mode='r'):
+    """ Opens a plain, compressed, or zipped dat file for reading
+
+    Compressed files are decompressed as they're read, rather than to disk. Use
+    mode 'rb' to read bytes.
+    """
+
+    zip_path = split_zip_path(dat_file)
+
+    if zip_path != None:
+        with zipfile.ZipFile(zip_path[0]) as archive:
+            member = archive.open(zip_path[1])
+
+        if mode == 'rb':
+            return member
+        return io.TextIOWrapper(member)
+
+    for extension, open_compressed in COMPRESSED_EXTENSIONS.items():
+        if dat_file.lower().endswith(extension):
+            return open_compressed(dat_file, 'rb' if mode == 'rb' else 'rt')
+
+    return open(dat_file, mode)
+
+
+def read_dat_lines(dat_file):
+    """ Yields the lines of a dat file one at a time
+
+    Plain dat files are memory-mapped, and compressed dat files are decompressed as
+    they're read, so the whole dat is never held as a list of lines.
+    """
+
+    if (
+        split_zip_path(dat_file) != None
+        or [x for x in COMPRESSED_EXTENSIONS if dat_file.lower().endswith(x)] != []):
+            with open_dat_file(dat_file) as input_file:
+                yield from input_file
+            return
+
+    encoding = locale.getpreferredencoding(False)
+
+    with open(dat_file, 'rb') as input_file:
+        # Empty files can't be memory-mapped
+        if os.fstat(input_file.fileno()).st_size == 0:
+            return
+
+        with mmap.mmap(input_file.fileno(), 0, access=mmap.ACCESS_READ) as dat_map:
+            for line in iter(dat_map.readline, b''):
+                # Handle line endings the same way as a file opened in text mode
+                yield from line.decode(encoding).splitlines(keepends=True)
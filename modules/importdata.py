@@ -4,7 +4,7 @@ import re
 import sys
 
 from modules.classes import CloneList, Regions, Tags
-from modules.utils import printwrap, Font
+from modules.utils import printwrap, required_text, Font
 
 
 def build_tags(TAGS):
@@ -43,6 +43,17 @@ def build_tags(TAGS):
                                 f'{Font.end}')
                 input_file_read.close()
 
+                # Compile the tags once, and find the text each needs so most tags can
+                # be ruled out for a title without running their regex
+                tag_strings.ignore_patterns = [
+                    (string, required_text(string), re.compile(string))
+                    for string in tag_strings.ignore]
+                tag_strings.edition_patterns = [
+                    (string, required_text(string), re.compile(string))
+                    for string in list(tag_strings.promote_editions) + list(tag_strings.demote_editions)]
+                tag_strings.disc_rename_pattern = re.compile(
+                    '|'.join([re.escape(key) for key in tag_strings.disc_rename]))
+
                 return tag_strings
 
         except OSError as e:
@@ -92,6 +103,34 @@ def build_regions(REGIONS):
                     for long_language, short_language in regiondata[REGIONS.languages].items():
                         regions.languages_short.append(short_language)
 
+                    # Give each language a bit, so titles' languages can be stored as
+                    # bitmasks. Implied languages share the bit of the language they
+                    # match.
+                    for i, short_language in enumerate(regions.languages_short):
+                        regions.language_bits[short_language] = 1 << i
+
+                    implied_bits = {
+                        required_text(language): bit for language, bit in regions.language_bits.items()}
+
+                    for language in regions.implied_language.values():
+                        if language != '' and language not in regions.language_bits:
+                            regions.language_bits[language] = implied_bits.setdefault(
+                                language, 1 << len(regions.language_bits))
+
+                # Set the languages titles are assumed to have in regions that don't
+                # imply a single language, when they don't list any
+                if REGIONS.region_languages in regiondata:
+                    for region, languages in regiondata[REGIONS.region_languages].items():
+                        regions.region_languages[region] = 0
+
+                        for language in languages:
+                            regions.region_languages[region] |= regions.language_bits[
+                                regions.languages_key[language]]
+
+                # Set the other names regions are known by in different dats
+                if REGIONS.aliases in regiondata:
+                    regions.aliases = regiondata[REGIONS.aliases]
+
                 input_file_read.close()
                 return regions
 
@@ -106,8 +145,8 @@ def build_regions(REGIONS):
         sys.exit()
 
 
-def build_clone_lists(input_dat):
-    """ Formats a clone list appriopriately """
+def get_clone_list_file(input_dat):
+    """ Returns the path of the clone list that matches the input dat """
 
     # Import JSON files that have the same name as dat_name + .json
     remove_string = ' \((Parent-Clone|J64|ROM|Decrypted|Encrypted|BigEndian|ByteSwapped)\)'
@@ -142,6 +181,15 @@ def build_clone_lists(input_dat):
                 clone_file = './clonelists/Sony - PlayStation Portable (Redump).json'
     else:
         clone_file = './clonelists/' + dat_name + '.json'
+
+    return clone_file
+
+
+def build_clone_lists(input_dat):
+    """ Formats a clone list appriopriately """
+
+    clone_file = get_clone_list_file(input_dat)
+
     if os.path.exists(clone_file) == True and os.path.isfile(clone_file) == True:
         try:
             with open(clone_file, 'r') as input_file_read:
@@ -178,8 +226,8 @@ def build_clone_lists(input_dat):
         )
 
 
-def import_metadata(dat_name):
-    """ Imports title metadata scraped from Redump """
+def get_metadata_file(dat_name):
+    """ Returns the path of the metadata file that matches the input dat """
 
     if 'GameCube' in dat_name and (
         'NKit GCZ' in dat_name or
@@ -198,6 +246,14 @@ def import_metadata(dat_name):
     else:
         metadata_file = './metadata/' + dat_name + '.json'
 
+    return metadata_file
+
+
+def import_metadata(dat_name):
+    """ Imports title metadata scraped from Redump """
+
+    metadata_file = get_metadata_file(dat_name)
+
     if os.path.exists(metadata_file) == True and os.path.isfile(metadata_file) == True:
         try:
             with open(metadata_file, 'r', encoding='utf-8') as input_file_read:
@@ -5,7 +5,7 @@ import re
 import sys
 
 from modules.classes import Stats
-from modules.utils import Font, natural_keys, printwrap
+from modules.utils import Font, hash_to_text, natural_keys, printwrap
 from modules.xml import header
 
 
@@ -114,20 +114,24 @@ def write_dat_file(input_dat, user_input, output_file_name, stats, titles, REGEX
                     rom_xml = []
 
                     for rom in title.roms:
-                        if rom.crc == '':
+                        crc = hash_to_text(rom.crc)
+                        md5 = hash_to_text(rom.md5)
+                        sha1 = hash_to_text(rom.sha1)
+
+                        if crc == '':
                             crc_string = ''
                         else:
-                            crc_string = f'crc="{rom.crc}" '
+                            crc_string = f'crc="{crc}" '
 
-                        if rom.md5 == '':
+                        if md5 == '':
                             md5_string = ''
                         else:
-                            md5_string = f'md5="{rom.md5}" '
+                            md5_string = f'md5="{md5}" '
 
-                        if rom.sha1 == '':
+                        if sha1 == '':
                             sha1_string = ''
                         else:
-                            sha1_string = f'sha1="{rom.sha1}" '
+                            sha1_string = f'sha1="{sha1}" '
                         rom_xml.append(
                             f'\n\t\t<rom {crc_string}{md5_string}'
                             f'name="{html.escape(rom.name, quote=False)}" {sha1_string}'
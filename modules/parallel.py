@@ -0,0 +1,211 @@
+import contextlib
+import functools
+import io
+import math
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+
+from modules.datfile import dat_file_size
+from modules.titleutils import (
+    choose_cross_region_parent, choose_parent, competing_cross_region_groups)
+
+# The runtime each worker process shares between the work it's sent, set when it starts
+worker_state = {}
+
+
+def start_pool(runtime):
+    """ Starts a pool of worker processes to choose parents with, or returns None if
+    the user hasn't set -j to more than one job
+    """
+
+    if runtime.user_input.jobs < 2:
+        return None
+
+    return multiprocessing.Pool(
+        runtime.user_input.jobs, initializer=start_worker, initargs=(runtime,))
+
+
+def start_worker(runtime):
+    """ Stores the runtime a worker process shares between the work it's sent """
+
+    worker_state['runtime'] = runtime
+
+
+def split_chunks(items, jobs):
+    """ Splits a list into a few chunks per job, so the work is spread evenly and
+    each worker isn't sent one item at a time
+    """
+
+    chunk_size = max(1, math.ceil(len(items) / (jobs * 4)))
+
+    return [items[i:i + chunk_size] for i in range(0, len(items), chunk_size)]
+
+
+def run_in_pool(pool, jobs, function, groups, REGEX):
+    """ Runs a function across the pool on chunks of a list of groups, and copies
+    the clone assignments the workers send back to each group's titles
+
+    Groups with a single title are skipped, as there's nothing to choose between.
+    """
+
+    chunks = split_chunks([x for x in groups if len(x) > 1], jobs)
+
+    for chunk, (assignments, hits, misses) in zip(chunks, pool.map(function, chunks)):
+        # Count the workers' pattern lookups, so verbose mode reports the same totals
+        REGEX.patterns.hits += hits
+        REGEX.patterns.misses += misses
+
+        for titles, title_assignments in zip(chunk, assignments):
+            for title, (cloneof, cloneof_group) in zip(titles, title_assignments):
+                title.cloneof = cloneof
+                title.cloneof_group = cloneof_group
+
+
+def choose_parents_in_pool(pool, jobs, groups, ring_code, REGEX):
+    """ Runs choose_parent on each of a list of a region's groups across the pool """
+
+    run_in_pool(
+        pool, jobs, functools.partial(parent_assignments, ring_code=ring_code), groups, REGEX)
+
+
+def choose_cross_region_parents_in_pool(pool, jobs, titles, input_dat, REGEX):
+    """ Runs choose_cross_region_parent on each group across the pool """
+
+    run_in_pool(
+        pool, jobs, cross_region_assignments, competing_cross_region_groups(titles, input_dat),
+        REGEX)
+
+    return titles
+
+
+def process_dats_in_pool(dat_files, function, runtime):
+    """ Runs a function on each dat file in a folder across a pool of processes,
+    and prints each file's console output in the original file order
+
+    The largest files are started first, so a big file isn't left running on its
+    own after the others have finished. Each file writes its output dats to its own
+    temporary folder, which are only moved to the output folder once the files
+    before it have finished.
+    """
+
+    output_folder = runtime.user_input.output_folder_name
+
+    temp_folders = [
+        tempfile.mkdtemp(prefix='.retool-', dir=output_folder) for dat_file in dat_files]
+
+    try:
+        with multiprocessing.Pool(
+            runtime.user_input.jobs, initializer=start_worker, initargs=(runtime,)) as pool:
+            largest_first = sorted(
+                range(len(dat_files)), key=lambda i: dat_file_size(dat_files[i]), reverse=True)
+
+            results = {
+                i: pool.apply_async(
+                    dat_file_output, (function, i, dat_files[i], temp_folders[i]))
+                for i in largest_first}
+
+            for i in range(len(dat_files)):
+                output, hits, misses, stopped = results[i].get()
+
+                sys.stdout.write(output)
+                sys.stdout.flush()
+
+                move_output(temp_folders[i], output_folder)
+
+                runtime.REGEX.patterns.hits += hits
+                runtime.REGEX.patterns.misses += misses
+
+                # Stop where the file that exited stopped, as if the folder was
+                # processed one file at a time. Leaving the pool stops the files
+                # after it.
+                if stopped == True:
+                    sys.exit()
+    finally:
+        # Delete the output of files that were stopped, or that came after a file
+        # that exited
+        for temp_folder in temp_folders:
+            shutil.rmtree(temp_folder, ignore_errors=True)
+
+
+def move_output(temp_folder, output_folder):
+    """ Moves the output dats a file wrote to its temporary folder to the output
+    folder, and removes the temporary folder
+    """
+
+    for file_name in sorted(os.listdir(temp_folder)):
+        os.replace(os.path.join(temp_folder, file_name), os.path.join(output_folder, file_name))
+
+    os.rmdir(temp_folder)
+
+
+def dat_file_output(function, i, dat_file, output_folder):
+    """ Runs a function on a dat file in a worker process, and returns what it
+    printed, how many pattern lookups it made, and whether it exited
+
+    Each file gets its own copy of the runtime's region lists and user input, so
+    files don't see each other's changes. Its output dats are written to
+    output_folder.
+    """
+
+    runtime = worker_state['runtime'].for_dat()
+
+    # The files are already spread across the pool, so each file chooses its
+    # parents in a single process
+    runtime.user_input.jobs = 1
+    runtime.user_input.output_folder_name = output_folder
+
+    patterns = runtime.REGEX.patterns
+    hits = patterns.hits
+    misses = patterns.misses
+    output = io.StringIO()
+    stopped = False
+
+    with contextlib.redirect_stdout(output):
+        try:
+            function(i, dat_file, runtime)
+        except SystemExit:
+            stopped = True
+
+    return output.getvalue(), patterns.hits - hits, patterns.misses - misses, stopped
+
+
+def parent_assignments(chunk, ring_code):
+    """ Runs choose_parent on a chunk of groups in a worker process, and returns the
+    clone assignments of each group's titles, and how many pattern lookups it made
+    """
+
+    runtime = worker_state['runtime']
+    patterns = runtime.REGEX.patterns
+    hits = patterns.hits
+    misses = patterns.misses
+    assignments = []
+
+    for titles in chunk:
+        choose_parent(titles, runtime.region_data, runtime.user_input, runtime.REGEX, ring_code)
+
+        assignments.append([(title.cloneof, title.cloneof_group) for title in titles])
+
+    return assignments, patterns.hits - hits, patterns.misses - misses
+
+
+def cross_region_assignments(chunk):
+    """ Runs choose_cross_region_parent on a chunk of groups in a worker process, and
+    returns the clone assignments of each group's titles, and how many pattern
+    lookups it made
+    """
+
+    runtime = worker_state['runtime']
+    patterns = runtime.REGEX.patterns
+    hits = patterns.hits
+    misses = patterns.misses
+    assignments = []
+
+    for titles in chunk:
+        choose_cross_region_parent(titles, runtime.user_input, runtime.REGEX)
+
+        assignments.append([(title.cloneof, title.cloneof_group) for title in titles])
+
+    return assignments, patterns.hits - hits, patterns.misses - misses
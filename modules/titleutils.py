@@ -6,8 +6,13 @@ import sys
 
 from modules.utils import Font, printverbose, printwrap
 
+@functools.lru_cache(maxsize=None)
 def check_date(string, title):
-        """ Basic date validation """
+        """ Basic date validation. Returns the title's date as an integer, or False if
+        it isn't valid.
+
+        The result is cached, as the same title is checked for each of its names.
+        """
 
         if re.search('\(\d{2}-\d{2}-\d{4}\)', title) != None:
             us_date = True
@@ -19,21 +24,24 @@ def check_date(string, title):
         else:
             short_date = False
 
-        title = title.replace(re.search(string, title)[0], re.search(string, title)[0].replace('-', ''))
+        date = re.search(string, title)[0]
+        title = title.replace(date, date.replace('-', ''))
 
         if short_date == True:
-            string = '\(\d{6}\)'
-            year = 1900 + int(re.search(string, title).group()[1:-5])
-            month = re.search(string, title).group()[3:-3]
-            day = re.search(string, title).group()[5:-1]
+            date = re.search('\(\d{6}\)', title).group()
+            year = str(1900 + int(date[1:-5]))
+            month = date[3:-3]
+            day = date[5:-1]
         elif us_date == True:
-            year = re.search(string, title).group()[5:-1]
-            month = re.search(string, title).group()[1:-7]
-            day = re.search(string, title).group()[3:-5]
+            date = re.search(string, title).group()
+            year = date[5:-1]
+            month = date[1:-7]
+            day = date[3:-5]
         else:
-            year = re.search(string, title).group()[1:-5]
-            month = re.search(string, title).group()[5:-3]
-            day = re.search(string, title).group()[7:-1]
+            date = re.search(string, title).group()
+            year = date[1:-5]
+            month = date[5:-3]
+            day = date[7:-1]
 
         if (
             int(year) >= 1970
@@ -137,49 +145,121 @@ def get_raw_title(title):
         return title.rstrip()
 
 
-def get_languages(title, REGEX_LANGUAGES):
+def get_languages(title, LANGUAGE_TAGS):
     """ Returns the languages from the input title """
 
-    languages = re.search(REGEX_LANGUAGES, title)
+    languages = LANGUAGE_TAGS.find(title)
 
     if languages != None:
-        return languages[0][2:-1]
+        return languages[2:-1]
     else:
         return ''
 
 
-def remove_languages(title, REGEX_LANGUAGES):
+def get_region_bits(regions, region_ranks):
+    """ Returns a title's regions as a bitset, with each region's rank in the user's
+    region order as its bit. Regions that aren't in the user's region order are
+    left out.
+
+    A title's regions can include text from the tag before them, for example
+    "2001) (Canada, Italy", so regions are found in the text rather than by
+    splitting it.
+    """
+
+    region_bits = 0
+
+    for region, rank in region_ranks.items():
+        if region in regions:
+            region_bits |= 1 << (rank - 1)
+
+    return region_bits
+
+
+def get_group_tags(titles):
+    """ Returns the tags and versions found in any of a list of DatNode objects
+
+    Parent selection only runs the rules for these, as a rule for a tag none of the
+    titles have can't remove a title.
+    """
+
+    tags = set()
+
+    for title in titles:
+        tags.update(title.features.tags)
+        tags.update(title.features.versions)
+
+    return tags
+
+
+def remove_languages(title, LANGUAGE_TAGS):
     """ Removes languages from the input title """
 
-    no_languages = re.search(REGEX_LANGUAGES, title)
+    no_languages = LANGUAGE_TAGS.find(title)
 
     if no_languages != None:
-        return title.replace(no_languages[0], '')
+        return title.replace(no_languages, '')
     else:
         return title
 
 
-def remove_regions(title, region_data):
+def remove_regions(title, region_data, REGEX):
     """ Removes regions from the input title, given the title and region_data object """
 
-    return title.replace(re.search(' \(((.*?,){0,} {0,})(' + '|'.join(region_data.all) + ').*?\)', title)[0],'')
+    return title.replace(REGEX.patterns.region_list(region_data.all).search(title)[0],'')
 
 
 def remove_tags(title, user_input, REGEX):
-    """ Removes tags from the input title that are in tags.json """
+    """ Removes tags from the input title that are in tags.json
 
-    for string in user_input.tag_strings.ignore:
-        if re.search(string, title) != None:
-            if string == REGEX.dates_whitespace and check_date(REGEX.dates, title) != False:
-                title = title.replace(re.search(REGEX.dates_whitespace, title)[0], '')
-            else:
-                title = title.replace(re.search(string, title)[0],'')
+    A tag's regex is only run if the text it needs is in the title.
+    """
+
+    for string, text, pattern in user_input.tag_strings.ignore_patterns:
+        if text in title:
+            tag = pattern.search(title)
+
+            if tag != None:
+                if string == REGEX.dates_whitespace and check_date(REGEX.dates, title) != False:
+                    title = title.replace(re.search(REGEX.dates_whitespace, title)[0], '')
+                else:
+                    title = title.replace(tag[0],'')
 
     return title
 
 
 def choose_parent(titles, region_data, user_input, REGEX, ring_code):
-    """ Determines a parent, given a list of DatNode objects
+    """ Determines a parent, given a list of DatNode objects that have their
+    TitleFeatures set
+
+    Titles are ranked with choose_parent_ranked where possible, falling back to
+    comparing each pair of titles with choose_parent_pairwise.
+    """
+
+    tags = get_group_tags(titles)
+
+    parents = choose_parent_ranked(titles, tags, region_data, user_input, REGEX, ring_code)
+
+    if parents == None:
+        parents = choose_parent_pairwise(titles, tags, region_data, user_input, REGEX, ring_code)
+
+    # Assign clones. If more than one parent has a title's short name, the title is
+    # a clone of the last of them.
+    parent_set = set(parents)
+    short_name_parents = {parent.short_name: parent for parent in parents}
+
+    for title in titles:
+        if title not in parent_set and title.short_name in short_name_parents:
+            parent = short_name_parents[title.short_name]
+            title.cloneof = parent.full_name
+            title.cloneof_group = parent.group
+
+    return titles
+
+
+def choose_parent_pairwise(titles, tags, region_data, user_input, REGEX, ring_code):
+    """ Determines the parents in a list of DatNode objects by comparing each pair
+    of titles, and returns them. Only the rules for the tags found by get_group_tags
+    are run.
 
     Redump seems to observe the following tagging order:
 
@@ -194,23 +274,35 @@ def choose_parent(titles, region_data, user_input, REGEX, ring_code):
     parents = titles.copy()
 
     # 1) Promote Virtual and Mini Console titles
-    choose_string(REGEX.switch_online, parents, REGEX, True)
-    choose_string(REGEX.wii_virtual_console, parents, REGEX, True)
-    choose_string(REGEX.threeds_virtual_console, parents, REGEX, True)
-    choose_string(REGEX.gamecube_virtual_console, parents, REGEX, True)
-    choose_string(REGEX.virtual_console, parents, REGEX, True)
-
-    # 2) Check for versions and revisions, and select the highest of each
-    choose_version_revision(REGEX.version, parents, REGEX, 2, -1)
-    choose_version_revision(REGEX.long_version, parents, REGEX, 8, -1)
-    choose_version_revision(REGEX.fds_version, parents, REGEX, 3, -1)
-    choose_version_revision(REGEX.revision, parents, REGEX, 5, -1)
-    choose_version_revision(REGEX.beta, parents, REGEX, 6, -1, True)
-    choose_version_revision(REGEX.alpha, parents, REGEX, 7, -1, True)
-    choose_version_revision(REGEX.proto, parents, REGEX, 7, -1, True)
+    for string in [
+        REGEX.switch_online,
+        REGEX.wii_virtual_console,
+        REGEX.threeds_virtual_console,
+        REGEX.gamecube_virtual_console,
+        REGEX.virtual_console]:
+            if string in tags:
+                choose_string(string, parents, REGEX, True)
+
+    # 2) Check for versions and revisions, and select the highest of each. Preproduction
+    # titles, and revisions against versions, are compared whichever version tag is
+    # being checked.
+    compare_all_versions = (
+        [x for x in parents if x.features.preproduction == True] != []
+        or (REGEX.revision in tags and REGEX.version in tags))
+
+    for string, trim_start, preproduction in [
+        (REGEX.version, 2, False),
+        (REGEX.long_version, 8, False),
+        (REGEX.fds_version, 3, False),
+        (REGEX.revision, 5, False),
+        (REGEX.beta, 6, True),
+        (REGEX.alpha, 7, True),
+        (REGEX.proto, 7, True)]:
+            if string in tags or compare_all_versions == True:
+                choose_version_revision(string, parents, REGEX, trim_start, -1, preproduction)
 
     # 3) Check for Sega/Panasonic ring codes
-    if ring_code == True:
+    if ring_code == True and REGEX.sega_ring_code in tags:
         choose_ring_code(REGEX, parents)
 
     # 4) If one title supports different languages to another, cycle through the implied
@@ -231,19 +323,21 @@ def choose_parent(titles, region_data, user_input, REGEX, ring_code):
             and title_2.languages != ''
             and title_1.title_languages != ''
             and title_2.title_languages != ''
-            and '[BIOS]' not in title_1.full_name
-            and '[BIOS]' not in title_2.full_name):
+            and title_1.features.bios == False
+            and title_2.features.bios == False):
                 found_language = False
                 if implied_languages != []:
                     for implied_language in implied_languages:
+                        language_bit = region_data.language_bits[implied_language]
+
                         if(
-                            bool(re.search(implied_language, title_1.languages)) == True
-                            and bool(re.search(implied_language, title_2.languages)) == False):
+                            title_1.features.languages & language_bit != 0
+                            and title_2.features.languages & language_bit == 0):
                                 if title_2 in parents: parents.remove(title_2)
                                 break
                         elif(
-                            bool(re.search(implied_language, title_2.languages)) == True
-                            and bool(re.search(implied_language, title_1.languages)) == False):
+                            title_2.features.languages & language_bit != 0
+                            and title_1.features.languages & language_bit == 0):
                                 if title_1 in parents: parents.remove(title_1)
                                 break
         elif (
@@ -255,18 +349,20 @@ def choose_parent(titles, region_data, user_input, REGEX, ring_code):
             and title_1.languages != title_2.languages
             and (title_1.title_languages == '' or
                  title_2.title_languages == '')
-            and '[BIOS]' not in title_1.full_name
-            and '[BIOS]' not in title_2.full_name):
+            and title_1.features.bios == False
+            and title_2.features.bios == False):
                 for region in user_input.user_region_order:
                     if region_data.implied_language[region] != '':
+                        language_bit = region_data.language_bits[region_data.implied_language[region]]
+
                         if (
-                            bool(re.search(region_data.implied_language[region], title_1.languages)) == True
-                            and bool(re.search(region_data.implied_language[region], title_2.languages)) == False):
+                            title_1.features.languages & language_bit != 0
+                            and title_2.features.languages & language_bit == 0):
                                 if title_2 in parents: parents.remove(title_2)
                                 break
                         elif (
-                            bool(re.search(region_data.implied_language[region], title_2.languages)) == True
-                            and bool(re.search(region_data.implied_language[region], title_1.languages)) == False):
+                            title_2.features.languages & language_bit != 0
+                            and title_1.features.languages & language_bit == 0):
                                 if title_1 in parents: parents.remove(title_1)
                                 break
 
@@ -276,18 +372,20 @@ def choose_parent(titles, region_data, user_input, REGEX, ring_code):
             title_1 in parents
             and title_2 in parents
             and title_1.short_name == title_2.short_name
-            and '[BIOS]' not in title_1.full_name
-            and '[BIOS]' not in title_2.full_name):
+            and title_1.features.bios == False
+            and title_2.features.bios == False):
                 for region in region_data.all:
                     if region_data.implied_language[region] != '':
+                        language_bit = region_data.language_bits[region_data.implied_language[region]]
+
                         if (
-                            bool(re.search(region_data.implied_language[region], title_1.languages)) == True
-                            and bool(re.search(region_data.implied_language[region], title_2.languages)) == False):
+                            title_1.features.languages & language_bit != 0
+                            and title_2.features.languages & language_bit == 0):
                                 if title_2 in parents: parents.remove(title_2)
                                 break
                         elif (
-                            bool(re.search(region_data.implied_language[region], title_2.languages)) == True
-                            and bool(re.search(region_data.implied_language[region], title_1.languages)) == False):
+                            title_2.features.languages & language_bit != 0
+                            and title_1.features.languages & language_bit == 0):
                                 if title_1 in parents: parents.remove(title_1)
                                 break
 
@@ -299,56 +397,54 @@ def choose_parent(titles, region_data, user_input, REGEX, ring_code):
     for title_1, title_2 in itertools.combinations(parents_temp, 2):
         if (
             title_1.short_name == title_2.short_name
-            and '[BIOS]' not in title_1.full_name
-            and '[BIOS]' not in title_2.full_name):
-            if (
-                len(re.findall(',', title_1.regions))
-                > len(re.findall(',', title_2.regions))):
-                    if title_2 in parents: parents.remove(title_2)
-            elif (
-                len(re.findall(',', title_2.regions))
-                > len(re.findall(',', title_1.regions))):
-                    if title_1 in parents: parents.remove(title_1)
-            elif (
-                len(re.findall(',', title_2.regions))
-                == len(re.findall(',', title_1.regions))):
-                    if title_1.primary_region != title_2.primary_region:
-                        for region in user_input.user_region_order:
-                            if region in title_1.primary_region:
-                                if title_2 in parents: parents.remove(title_2)
-                                break
-                            if region in title_2.primary_region:
-                                if title_1 in parents: parents.remove(title_1)
-                                break
-                    elif (
-                        title_1.primary_region == title_2.primary_region
-                        and title_1.secondary_region != title_2.secondary_region):
-                            for region in user_input.user_region_order:
-                                if region in title_1.secondary_region:
-                                    if title_2 in parents: parents.remove(title_2)
-                                    break
-                                if region in title_2.secondary_region:
-                                    if title_1 in parents: parents.remove(title_1)
-                                    break
+            and title_1.features.bios == False
+            and title_2.features.bios == False):
+            if title_1.regions.count(',') > title_2.regions.count(','):
+                if title_2 in parents: parents.remove(title_2)
+            elif title_2.regions.count(',') > title_1.regions.count(','):
+                if title_1 in parents: parents.remove(title_1)
+            else:
+                # The title with the higher ranked region wins. If both titles have
+                # the same ranked secondary region, it's found in title_1 first.
+                if title_1.primary_region != title_2.primary_region:
+                    if title_1.features.primary_rank > title_2.features.primary_rank:
+                        if title_2 in parents: parents.remove(title_2)
+                    elif title_2.features.primary_rank > title_1.features.primary_rank:
+                        if title_1 in parents: parents.remove(title_1)
+                elif title_1.secondary_region != title_2.secondary_region:
+                    if (
+                        title_1.features.secondary_rank != 0
+                        and title_1.features.secondary_rank >= title_2.features.secondary_rank):
+                            if title_2 in parents: parents.remove(title_2)
+                    elif title_2.features.secondary_rank != 0:
+                        if title_1 in parents: parents.remove(title_1)
 
     # 6) Choose higher dates where possible
-    choose_date(REGEX.dates, parents)
+    if REGEX.dates in tags:
+        choose_date(REGEX.dates, parents)
 
     # 7) Choose good, original versions over alternates
-    choose_string(REGEX.alt, parents, REGEX)
-    choose_string(REGEX.oem, parents, REGEX)
-    choose_string(REGEX.bad, parents, REGEX)
-    choose_string(REGEX.hibaihin, parents, REGEX)
-    choose_string(REGEX.covermount, parents, REGEX)
-    choose_string(REGEX.rerelease, parents, REGEX)
-    choose_string(REGEX.edc, parents, REGEX, True)
+    for string in [
+        REGEX.alt,
+        REGEX.oem,
+        REGEX.bad,
+        REGEX.hibaihin,
+        REGEX.covermount,
+        REGEX.rerelease]:
+            if string in tags:
+                choose_string(string, parents, REGEX)
+
+    if REGEX.edc in tags:
+        choose_string(REGEX.edc, parents, REGEX, True)
 
     # 8) Deal with promotions and demotions of editions
     for edition in user_input.tag_strings.promote_editions:
-        choose_string(edition, parents, REGEX, True)
+        if edition in tags:
+            choose_string(edition, parents, REGEX, True)
 
     for edition in user_input.tag_strings.demote_editions:
-        choose_string(edition, parents, REGEX)
+        if edition in tags:
+            choose_string(edition, parents, REGEX)
 
     # 9) Deal with "Made in" titles for Sega CD and Sega Saturn
     if ring_code == True:
@@ -363,98 +459,446 @@ def choose_parent(titles, region_data, user_input, REGEX, ring_code):
                         '\(Made in.*?\)', title_2.full_name)[0].replace('.', '').replace('EU', 'Europe')):
                     if title_1 in parents: parents.remove(title_1)
 
-    # Assign clones
-    for parent in parents:
-        for title in titles:
-            if (
-                title in [x for x in titles if x not in parents]
-                and title.short_name == parent.short_name):
-                    title.cloneof = parent.full_name
-                    title.cloneof_group = parent.group
+    return parents
 
-    return titles
 
+def compares_across_short_names(titles, ring_code):
+    """ Returns whether choose_parent_pairwise compares any of a list of DatNode
+    objects against titles with a different short name
+
+    Preproduction titles change how every later version is compared, and are
+    removed even when compared against titles with a different short name. Ring
+    codes and "Made in" tags are also compared across short names.
+    """
+
+    for title in titles:
+        if title.features.preproduction == True:
+            return True
+
+    if ring_code == True:
+        if len([x for x in titles if x.features.ring_code != None]) > 1:
+            return True
+
+        if len([x for x in titles if 'Made in' in x.full_name]) > 1:
+            return True
+
+    return False
+
+
+def competing_groups(groups, input_dat, ring_code):
+    """ Returns the groups in a region that parents need to be chosen for, and counts
+    the rest in the Dat object
+
+    In the other groups, no two titles share a short name or are otherwise compared,
+    so every title is its own parent.
+    """
+
+    competing = []
+
+    for titles in groups.values():
+        if (
+            len(titles) > 1
+            and (
+                shares_short_names(titles) == True
+                or compares_across_short_names(titles, ring_code) == True)):
+                    competing.append(titles)
+
+    input_dat.group_count += len(groups)
+    input_dat.trivial_group_count += len(groups) - len(competing)
+
+    return competing
+
+
+def competing_cross_region_groups(titles, input_dat):
+    """ Combines the titles from all regions, and returns the groups that
+    cross-region parents need to be chosen for. The rest are counted in the Dat
+    object.
+
+    Cross-region parents are only chosen between titles that share a short name.
+    """
+
+    combine_regions(titles)
+
+    competing = [x for x in titles.all.values() if shares_short_names(x) == True]
+
+    input_dat.group_count += len(titles.all)
+    input_dat.trivial_group_count += len(titles.all) - len(competing)
+
+    return competing
+
+
+def shares_short_names(titles):
+    """ Returns whether any two of a list of DatNode objects share a short name """
+
+    return len({x.short_name for x in titles}) != len(titles)
+
+
+def choose_parent_ranked(titles, tags, region_data, user_input, REGEX, ring_code):
+    """ Determines the parents in a list of DatNode objects by ranking titles, and
+    returns them
+
+    Titles are bucketed by short name, and each title gets a key that encodes the
+    rules of choose_parent_pairwise in the same order. The titles with the highest
+    key in each bucket are the parents.
+
+    Some titles make the pairwise comparisons depend on the order titles are
+    compared in, which a key can't reproduce. If any are found, returns None so
+    choose_parent_pairwise can be used instead.
+    """
+
+    if compares_across_short_names(titles, ring_code) == True:
+        return None
+
+    buckets = {}
+    parents = set()
+
+    for title in titles:
+        if title.features.bios == True:
+            parents.add(title)
+        elif title.short_name not in buckets:
+            buckets[title.short_name] = [title]
+        else:
+            buckets[title.short_name].append(title)
+
+    for bucket in buckets.values():
+        if len(bucket) == 1:
+            parents.add(bucket[0])
+            continue
+
+        keys = rank_titles(bucket, tags, region_data, user_input, REGEX, ring_code)
+
+        if keys == None:
+            return None
+
+        highest_key = max(keys)
+
+        parents.update([title for title, key in zip(bucket, keys) if key == highest_key])
+
+    return [x for x in titles if x in parents]
+
+
+def rank_titles(titles, tags, region_data, user_input, REGEX, ring_code):
+    """ Returns a ranking key for each title in a list of DatNode objects that share
+    a short name. Each part of the key matches a rule in choose_parent_pairwise,
+    in the same order, so comparing keys picks the same parents. Rules for tags that
+    aren't in the group's tags would rank every title the same, so they're left out.
+
+    Returns None if the titles can't be ranked consistently.
+    """
+
+    # Revisions lose to versions whichever version tag is being compared, which
+    # can't be ranked alongside the other version tags
+    if (
+        [x for x in titles if REGEX.revision in x.features.tags] != []
+        and [x for x in titles if REGEX.version in x.features.tags] != []):
+            return None
+
+    columns = []
+
+    # 1) Promote Virtual and Mini Console titles
+    for string in [
+        REGEX.switch_online,
+        REGEX.wii_virtual_console,
+        REGEX.threeds_virtual_console,
+        REGEX.gamecube_virtual_console,
+        REGEX.virtual_console]:
+            if string in tags:
+                columns.append([rank_string(string, x, REGEX, True) for x in titles])
+
+    # 2) Versions and revisions
+    for string, trim_start, preproduction in [
+        (REGEX.version, 2, False),
+        (REGEX.long_version, 8, False),
+        (REGEX.fds_version, 3, False),
+        (REGEX.revision, 5, False),
+        (REGEX.beta, 6, True),
+        (REGEX.alpha, 7, True),
+        (REGEX.proto, 7, True)]:
+            if string not in tags:
+                continue
+
+            column = rank_version_revision(string, titles, trim_start, -1, preproduction)
+
+            if column == None:
+                return None
+
+            columns.append(column)
+
+    # 3) Sega/Panasonic ring codes
+    if ring_code == True and REGEX.sega_ring_code in tags:
+        columns.append([rank_string(REGEX.sega_ring_code, x, REGEX, True) for x in titles])
+
+    # 4) Implied languages, in the user's region order, then all regions
+    user_languages = []
+    all_languages = []
+
+    for region in user_input.user_region_order:
+        if region_data.implied_language[region] not in user_languages + ['']:
+            user_languages.append(region_data.implied_language[region])
+
+    for region in region_data.all:
+        if region_data.implied_language[region] not in all_languages + ['']:
+            all_languages.append(region_data.implied_language[region])
 
-def choose_cross_region_parents(titles, user_input, REGEX):
+    columns.append([
+        (
+            tuple([title.features.languages & region_data.language_bits[x] != 0 for x in user_languages]),
+            tuple([title.features.languages & region_data.language_bits[x] != 0 for x in all_languages])
+        ) for title in titles])
+
+    # 5) Regions
+    column = rank_regions(titles, user_input)
+
+    if column == None:
+        return None
+
+    columns.append(column)
+
+    # 6) Dates
+    if REGEX.dates in tags:
+        column = rank_date(REGEX.dates, titles)
+
+        if column == None:
+            return None
+
+        columns.append(column)
+
+    # 7) Good, original versions over alternates
+    for string in [
+        REGEX.alt,
+        REGEX.oem,
+        REGEX.bad,
+        REGEX.hibaihin,
+        REGEX.covermount,
+        REGEX.rerelease]:
+            if string in tags:
+                columns.append([rank_string(string, x, REGEX) for x in titles])
+
+    if REGEX.edc in tags:
+        columns.append([rank_string(REGEX.edc, x, REGEX, True) for x in titles])
+
+    # 8) Promotions and demotions of editions
+    for edition in user_input.tag_strings.promote_editions:
+        if edition in tags:
+            columns.append([rank_string(edition, x, REGEX, True) for x in titles])
+
+    for edition in user_input.tag_strings.demote_editions:
+        if edition in tags:
+            columns.append([rank_string(edition, x, REGEX) for x in titles])
+
+    return list(zip(*columns))
+
+
+def rank_date(string, title_list):
+    """ Returns each title's rank for choose_date, or None if a title has an invalid
+    date and another has a valid date, as choose_date doesn't compare those.
+    """
+
+    column = []
+    invalid_date = False
+
+    for title in title_list:
+        if string not in title.features.tags:
+            column.append(0)
+            continue
+
+        if title.features.date == False:
+            invalid_date = True
+            column.append(0)
+        else:
+            column.append(title.features.date)
+
+    if invalid_date == True and [x for x in column if x != 0] != []:
+        return None
+
+    return column
+
+
+def rank_regions(title_list, user_input):
+    """ Returns each title's rank by its number of regions, then its primary and
+    secondary regions in the user's region order.
+
+    Returns None if two different regions rank the same, as the pairwise comparison
+    then depends on which title comes first.
+    """
+
+    column = []
+    primary_regions = {}
+    secondary_regions = {}
+
+    for title in title_list:
+        primary_rank = title.features.primary_rank
+        secondary_rank = title.features.secondary_rank
+
+        if primary_regions.setdefault(primary_rank, title.primary_region) != title.primary_region:
+            return None
+
+        # Unranked secondary regions aren't compared, so they can share a rank
+        if (
+            secondary_rank != 0
+            and secondary_regions.setdefault(
+                (title.primary_region, secondary_rank), title.secondary_region) != title.secondary_region):
+                    return None
+
+        column.append((title.regions.count(','), primary_rank, secondary_rank))
+
+    return column
+
+
+def rank_string(string, title, REGEX, choose_title_with_string=False):
+    """ Returns a title's rank for choose_string """
+
+    if string not in title.features.tags:
+        return (int(choose_title_with_string == False), 0)
+
+    # Titles that both have a ring code aren't compared by length
+    if string == REGEX.sega_ring_code or string == REGEX.sega_ring_code_re:
+        return (int(choose_title_with_string), 0)
+
+    return (int(choose_title_with_string), len(title.full_name))
+
+
+def rank_version_revision(string, title_list, trim_start, trim_end, preproduction=False):
+    """ Returns each title's rank for choose_version_revision
+
+    Returns None if a tag is found in the title but not the region free name, or the
+    versions would be compared as numbers by some titles and text by others.
+    """
+
+    versions = []
+
+    for title in title_list:
+        version = title.features.versions.get(string)
+
+        if (version != None) != (string in title.features.tags):
+            return None
+
+        if version == None:
+            versions.append(None)
+        else:
+            versions.append(version[trim_start:trim_end])
+
+    found_versions = [x for x in versions if x != None]
+
+    # Versions are only compared when more than one title has them
+    if len(found_versions) > 1:
+        if string == re.compile('\(DV [0-9].*?\)'):
+            versions = [int(x) if x != None else None for x in versions]
+        elif [
+            x for x in found_versions
+            if bool(re.search('[A-Za-z]', x)) == False
+            and len(x) == 2] != []:
+                return None
+
+    return [
+        (int(preproduction), '') if x == None else (int(preproduction == False), x)
+        for x in versions]
+
+
+def choose_cross_region_parents(titles, input_dat, user_input, REGEX):
     """ Finds parents given a list of DatNode objects from multiple regions.
 
     This assumes choose_parent has already been run across all regions prior to them
     being processed here.
     """
 
-    # Add titles from all regions into a single dict
-    for region, groups in titles.regions.items():
-        for group, disc_titles in groups.items():
-            if group not in titles.all:
-                titles.all[group] = []
-            for title in disc_titles:
-                titles.all[group].extend([title])
-
     # Find the cross-region parents
-    for key, values in titles.all.items():
-        parents = values.copy()
+    for values in competing_cross_region_groups(titles, input_dat):
+        choose_cross_region_parent(values, user_input, REGEX)
 
-        for title_1, title_2 in itertools.combinations(parents, 2):
-            if (
-                title_1.short_name == title_2.short_name
-                and title_1.regions != title_2.regions
-                and '[BIOS]' not in title_1.full_name
-                and '[BIOS]' not in title_2.full_name):
+    return titles
 
-                # Check to see if titles are preproduction or not. If so, favour
-                # production titles
-                preprod_title_1 = bool(re.search(REGEX.preproduction_long, title_1.full_name))
-                preprod_title_2 = bool(re.search(REGEX.preproduction_long, title_2.full_name))
 
-                if preprod_title_1 == True and preprod_title_2 == False:
-                    if title_1 in parents: parents.remove(title_1)
-                elif preprod_title_2 == True and preprod_title_1 == False:
-                    if title_2 in parents: parents.remove(title_2)
+def choose_cross_region_parent(values, user_input, REGEX):
+    """ Finds the cross-region parents in a list of DatNode objects that share a
+    group
+    """
 
-        for title_1, title_2 in itertools.combinations(parents, 2):
-            if (
-                title_1.short_name == title_2.short_name
-                and title_1.regions != title_2.regions
-                and '[BIOS]' not in title_1.full_name
-                and '[BIOS]' not in title_2.full_name):
-                for region in user_input.user_region_order:
-                    if (
-                        region in title_1.regions
-                        and region not in title_2.regions
-                        and title_1.cloneof == ''):
-                        if title_2 in parents: parents.remove(title_2)
-                        break
-                    elif (
-                        region in title_2.regions
-                        and region not in title_1.regions
-                        and title_2.cloneof == ''):
-                        if title_1 in parents: parents.remove(title_1)
-                        break
-                    elif (
-                        region in title_1.regions
-                        and region in title_2.regions
-                        and title_1.primary_region != title_2.primary_region):
+    # The titles that lose a comparison. Each pass compares the titles left at its
+    # start.
+    removed = set()
 
-                        if title_1.cloneof == '':
-                            if title_2 in parents:
-                                parents.remove(title_2)
-                                break
-                        elif title_2.cloneof == '':
-                            if title_1 in parents:
-                                parents.remove(title_1)
-                                break
+    for title_1, title_2 in itertools.combinations(values, 2):
+        if (
+            title_1.short_name == title_2.short_name
+            and title_1.regions != title_2.regions
+            and title_1.features.bios == False
+            and title_2.features.bios == False):
+
+            # Check to see if titles are preproduction or not. If so, favour
+            # production titles
+            preprod_title_1 = title_1.features.preproduction
+            preprod_title_2 = title_2.features.preproduction
+
+            if preprod_title_1 == True and preprod_title_2 == False:
+                removed.add(title_1)
+            elif preprod_title_2 == True and preprod_title_1 == False:
+                removed.add(title_2)
+
+    parents = [x for x in values if x not in removed]
+
+    for title_1, title_2 in itertools.combinations(parents, 2):
+        if (
+            title_1.short_name == title_2.short_name
+            and title_1.regions != title_2.regions
+            and title_1.features.bios == False
+            and title_2.features.bios == False):
+            # Only the user's regions that are in either title can match, so check
+            # those from highest to lowest rank
+            regions = title_1.features.regions | title_2.features.regions
+
+            while regions != 0:
+                region = 1 << (regions.bit_length() - 1)
+                regions ^= region
 
-        # Assign clones
-        for parent in parents:
-            for title in values:
                 if (
-                    title in [x for x in values if x not in parents]
-                    and title.short_name == parent.short_name
-                    and parent.cloneof == ''):
-                        title.cloneof = parent.full_name
-                        title.cloneof_group = get_raw_title(parent.full_name)
+                    title_1.features.regions & region != 0
+                    and title_2.features.regions & region == 0
+                    and title_1.cloneof == ''):
+                    removed.add(title_2)
+                    break
+                elif (
+                    title_2.features.regions & region != 0
+                    and title_1.features.regions & region == 0
+                    and title_2.cloneof == ''):
+                    removed.add(title_1)
+                    break
+                elif (
+                    title_1.features.regions & region != 0
+                    and title_2.features.regions & region != 0
+                    and title_1.primary_region != title_2.primary_region):
+
+                    if title_1.cloneof == '':
+                        if title_2 not in removed:
+                            removed.add(title_2)
+                            break
+                    elif title_2.cloneof == '':
+                        if title_1 not in removed:
+                            removed.add(title_1)
+                            break
+
+    # Assign clones. If more than one parent has a title's short name, the title is
+    # a clone of the last of them.
+    short_name_parents = {
+        parent.short_name: parent for parent in values
+        if parent not in removed and parent.cloneof == ''}
+
+    for title in values:
+        if title in removed and title.short_name in short_name_parents:
+            parent = short_name_parents[title.short_name]
+            title.cloneof = parent.full_name
+            title.cloneof_group = get_raw_title(parent.full_name)
+
+
+def combine_regions(titles):
+    """ Adds titles from all regions into a single dict """
 
-    return titles
+    for region, groups in titles.regions.items():
+        for group, disc_titles in groups.items():
+            if group not in titles.all:
+                titles.all[group] = []
+            for title in disc_titles:
+                titles.all[group].extend([title])
 
 
 def choose_date(string, title_list):
@@ -468,26 +912,26 @@ def choose_date(string, title_list):
     for title_1, title_2 in itertools.combinations(title_list_temp, 2):
         if (
             title_1.short_name == title_2.short_name
-            and '[BIOS]' not in title_1.full_name
-            and '[BIOS]' not in title_2.full_name):
+            and title_1.features.bios == False
+            and title_2.features.bios == False):
             if (
-                re.search(string, title_1.full_name) != None
-                and re.search(string, title_2.full_name) == None
-                and check_date(string, title_1.full_name) != False):
+                string in title_1.features.tags
+                and string not in title_2.features.tags
+                and title_1.features.date != False):
                     if title_2 in title_list: title_list.remove(title_2)
             elif (
-                re.search(string, title_2.full_name) != None
-                and re.search(string, title_1.full_name) == None
-                and check_date(string, title_2.full_name) != False):
+                string in title_2.features.tags
+                and string not in title_1.features.tags
+                and title_2.features.date != False):
                     if title_1 in title_list: title_list.remove(title_1)
             elif (
-                re.search(string, title_1.full_name) != None
-                and re.search(string, title_2.full_name) != None
-                and check_date(string, title_1.full_name) != False
-                and check_date(string, title_2.full_name) != False):
-                    if check_date(string, title_1.full_name) > check_date(string, title_2.full_name):
+                string in title_1.features.tags
+                and string in title_2.features.tags
+                and title_1.features.date != False
+                and title_2.features.date != False):
+                    if title_1.features.date > title_2.features.date:
                         if title_2 in title_list: title_list.remove(title_2)
-                    elif check_date(string, title_2.full_name) > check_date(string, title_1.full_name):
+                    elif title_2.features.date > title_1.features.date:
                         if title_1 in title_list: title_list.remove(title_1)
 
 
@@ -503,10 +947,10 @@ def choose_ring_code(REGEX, title_list):
     for title_1, title_2 in itertools.combinations(title_list_temp, 2):
         if title_1.short_name == title_2.short_name:
             if (
-                re.search(REGEX.sega_ring_code, title_1.full_name) != None
-                and re.search(REGEX.sega_ring_code, title_2.full_name) != None):
-                    title_1_ring_code = re.search(REGEX.sega_ring_code, title_1.full_name)[0]
-                    title_2_ring_code = re.search(REGEX.sega_ring_code, title_2.full_name)[0]
+                title_1.features.ring_code != None
+                and title_2.features.ring_code != None):
+                    title_1_ring_code = title_1.features.ring_code
+                    title_2_ring_code = title_2.features.ring_code
 
                     # Get the highest version ring code
                     if (
@@ -569,18 +1013,18 @@ def choose_string(string, title_list, REGEX, choose_title_with_string=False):
         for title_1, title_2 in itertools.combinations(title_list_temp, 2):
             if (
                 title_1.short_name == title_2.short_name
-                and '[BIOS]' not in title_1.full_name
-                and '[BIOS]' not in title_2.full_name):
+                and title_1.features.bios == False
+                and title_2.features.bios == False):
                 if (
-                    re.search(string, title_1.full_name) != None
-                    and re.search(string, title_2.full_name) == None):
+                    string in title_1.features.tags
+                    and string not in title_2.features.tags):
                     if choose_title_with_string == False:
                         if title_1 in title_list: title_list.remove(title_1)
                     else:
                         if title_2 in title_list: title_list.remove(title_2)
                 elif (
-                    re.search(string, title_2.full_name) != None
-                    and re.search(string, title_1.full_name) == None):
+                    string in title_2.features.tags
+                    and string not in title_1.features.tags):
                         if choose_title_with_string == False:
                             if title_2 in title_list: title_list.remove(title_2)
                         else:
@@ -588,8 +1032,8 @@ def choose_string(string, title_list, REGEX, choose_title_with_string=False):
                 elif (
                     # Bit of a hack. If it finds the same string in both titles, select
                     # the one that's longer, as long as the string isn't a ring code.
-                    re.search(string, title_2.full_name) != None
-                    and re.search(string, title_1.full_name) != None
+                    string in title_2.features.tags
+                    and string in title_1.features.tags
                     and string != REGEX.sega_ring_code
                     and string != REGEX.sega_ring_code_re):
                         if len(title_2.full_name) < len(title_1.full_name):
@@ -610,8 +1054,8 @@ def choose_version_revision(string, title_list, REGEX, trim_start, trim_end, pre
         # Check to see if titles are preproduction or not. If so, favour
         # production titles
         preprod_check = []
-        preprod_title_1 = bool(re.search(REGEX.preproduction_long, title_1.full_name))
-        preprod_title_2 = bool(re.search(REGEX.preproduction_long, title_2.full_name))
+        preprod_title_1 = title_1.features.preproduction
+        preprod_title_2 = title_2.features.preproduction
 
         preprod_check.extend([preprod_title_1, preprod_title_2])
 
@@ -621,28 +1065,28 @@ def choose_version_revision(string, title_list, REGEX, trim_start, trim_end, pre
         if (
             (
                 title_1.short_name == title_2.short_name
-                and '[BIOS]' not in title_1.full_name
-                and '[BIOS]' not in title_2.full_name
+                and title_1.features.bios == False
+                and title_2.features.bios == False
                 and (
                     functools.reduce(lambda a,b: a + b, preprod_check) == 2
                     or functools.reduce(lambda a,b: a + b, preprod_check) == 0))):
                     # Deal with mixed versions and revisions
                     if (
-                        re.search(REGEX.revision, title_1.full_name) != None
-                        and re.search(REGEX.version, title_2.full_name) != None):
+                        REGEX.revision in title_1.features.tags
+                        and REGEX.version in title_2.features.tags):
                             if title_1 in title_list: title_list.remove(title_1)
                     elif (
-                        re.search(REGEX.revision, title_2.full_name) != None
-                        and re.search(REGEX.version, title_1.full_name) != None):
+                        REGEX.revision in title_2.features.tags
+                        and REGEX.version in title_1.features.tags):
                             if title_2 in title_list: title_list.remove(title_2)
 
                     # Now the normal version comparisons
                     elif (
-                        re.search(string, title_1.region_free_name) != None
-                        and re.search(string, title_2.region_free_name) != None):
+                        string in title_1.features.versions
+                        and string in title_2.features.versions):
                             # Find the highest version
-                            ver_1 = re.search(string, title_1.region_free_name)[0][trim_start:trim_end]
-                            ver_2 = re.search(string, title_2.region_free_name)[0][trim_start:trim_end]
+                            ver_1 = title_1.features.versions[string][trim_start:trim_end]
+                            ver_2 = title_2.features.versions[string][trim_start:trim_end]
 
                             if string == re.compile('\(DV [0-9].*?\)'):
                                 ver_1 = int(ver_1)
@@ -663,26 +1107,26 @@ def choose_version_revision(string, title_list, REGEX, trim_start, trim_end, pre
                             elif ver_2 > ver_1:
                                 if title_1 in title_list: title_list.remove(title_1)
                     elif (
-                        re.search(string, title_1.region_free_name) != None
-                        or re.search(string, title_2.region_free_name) != None):
+                        string in title_1.features.versions
+                        or string in title_2.features.versions):
                             if (
-                                re.search(string, title_1.full_name) != None
-                                and re.search(string, title_2.full_name) == None):
+                                string in title_1.features.tags
+                                and string not in title_2.features.tags):
                                     if preproduction == False:
                                         if title_2 in title_list: title_list.remove(title_2)
                                     else:
                                         if title_1 in title_list: title_list.remove(title_1)
                             elif (
-                                re.search(string, title_1.full_name) == None
-                                and re.search(string, title_2.full_name) != None):
+                                string not in title_1.features.tags
+                                and string in title_2.features.tags):
                                     if preproduction == False:
                                         if title_1 in title_list: title_list.remove(title_1)
                                     else:
                                         if title_2 in title_list: title_list.remove(title_2)
         elif (
             functools.reduce(lambda a,b: a + b, preprod_check) == 1
-            and '[BIOS]' not in title_1.full_name
-            and '[BIOS]' not in title_2.full_name):
+            and title_1.features.bios == False
+            and title_2.features.bios == False):
 
             if preprod_title_1 == True and preprod_title_2 == False:
                 if title_1 in title_list: title_list.remove(title_1)
@@ -691,6 +1135,22 @@ def choose_version_revision(string, title_list, REGEX, trim_start, trim_end, pre
 
 
 
+def index_titles(titles):
+    """ Returns dicts of the titles in each group of titles.all, keyed by their group
+    and short name, and by their group and full name
+    """
+
+    short_names = {}
+    full_names = {}
+
+    for group, group_titles in titles.all.items():
+        for title in group_titles:
+            short_names.setdefault((group, title.short_name), []).append(title)
+            full_names.setdefault((group, title.full_name), []).append(title)
+
+    return short_names, full_names
+
+
 def assign_clones(titles, input_dat, region_data, user_input, REGEX):
     """ Assigns clones manually from clone lists """
 
@@ -699,6 +1159,10 @@ def assign_clones(titles, input_dat, region_data, user_input, REGEX):
         progress_old = 0
         progress_total = len(input_dat.clone_lists.renames)
 
+        # Index each group's titles by short name and full name, so the entries in
+        # the clone list can be found without searching their groups
+        short_names, full_names = index_titles(titles)
+
         for key, values in input_dat.clone_lists.renames.items():
             # Find the full names of the entries in the clone list
             clones = []
@@ -711,13 +1175,10 @@ def assign_clones(titles, input_dat, region_data, user_input, REGEX):
                 print(f'* Assigning clones from clone lists... [{str(progress_percent)}%]', sep='', end='\r', flush=True)
 
             if get_raw_title(key) in titles.all:
-                group = []
-                for title in titles.all[get_raw_title(key)]:
-                    group.append(title.short_name)
-                    if title.short_name == key:
-                        clones.append((title, 1))
+                for title in short_names.get((get_raw_title(key), key), []):
+                    clones.append((title, 1))
 
-                if key not in group:
+                if (get_raw_title(key), key) not in short_names:
                     printverbose(
                         user_input.verbose,
                         f'{Font.warning}* Title in clone list not found in dat or selected regions: '
@@ -741,14 +1202,10 @@ def assign_clones(titles, input_dat, region_data, user_input, REGEX):
                         clone_title, clone_priority = value[0], value[1]
 
                         if get_raw_title(clone_title) in titles.all:
-                            group = []
-
-                            for title in titles.all[get_raw_title(clone_title)]:
-                                group.append(title.short_name)
-                                if title.short_name == clone_title:
-                                    clones.append((title, clone_priority))
+                            for title in short_names.get((get_raw_title(clone_title), clone_title), []):
+                                clones.append((title, clone_priority))
 
-                            if clone_title not in group:
+                            if (get_raw_title(clone_title), clone_title) not in short_names:
                                 printverbose(
                                     user_input.verbose,
                                     f'{Font.warning}* Title in clone list not found in dat or selected regions: '
@@ -765,6 +1222,7 @@ def assign_clones(titles, input_dat, region_data, user_input, REGEX):
                     f'{Font.warning_bold}{key}{Font.end}')
 
             # Figure out which clone to make a parent, based on region and language
+            sorted_clones = sorted(clones, key=operator.itemgetter(1))
             priority_range = range(-1, 10) if user_input.supersets == True else range(0, 10)
 
             for i in priority_range:
@@ -772,7 +1230,9 @@ def assign_clones(titles, input_dat, region_data, user_input, REGEX):
                     found_parent = False
                     for region in user_input.user_region_order:
                         if region_data.implied_language[region] != '':
-                            for clone in sorted(clones, key=operator.itemgetter(1)):
+                            language_bit = region_data.language_bits[region_data.implied_language[region]]
+
+                            for clone in sorted_clones:
                                 clone_title, clone_priority = clone[0], clone[1]
                                 if (
                                     clone_title.cloneof == ''
@@ -781,7 +1241,7 @@ def assign_clones(titles, input_dat, region_data, user_input, REGEX):
                                         # If a title priority is set to 0 and has the same language as a higher region priority,
                                         # don't overwrite it.
                                         if (
-                                            bool(re.search(region_data.implied_language[region], clone_title.languages)) == True
+                                            clone_title.features.languages & language_bit != 0
                                             and (clone_priority == -1 or clone_priority == 0)):
                                                 found_parent = True
                                                 parent = clone
@@ -792,7 +1252,7 @@ def assign_clones(titles, input_dat, region_data, user_input, REGEX):
                                             break
                             if found_parent == True: break
                         elif region in clone_title.regions:
-                            for clone in sorted(clones, key=operator.itemgetter(1)):
+                            for clone in sorted_clones:
                                 clone_title, clone_priority = clone[0], clone[1]
                                 found_parent = True
                                 parent = clone
@@ -831,7 +1291,7 @@ def assign_clones(titles, input_dat, region_data, user_input, REGEX):
                     for clone in clones:
                         clone_title, clone_priority = clone[0], clone[1]
 
-                        for disc_title in titles.all[clone_title.group]:
+                        for disc_title in full_names.get((clone_title.group, clone_title.full_name), []):
                             if (
                                 clone_title.full_name == disc_title.full_name
                                 and clone_title.full_name == parent[0].full_name
@@ -867,15 +1327,13 @@ def assign_clones(titles, input_dat, region_data, user_input, REGEX):
                                     clone[0].cloneof = 'Retool_Replace'
 
                         for clone in clones:
-                            for region in user_input.user_region_order:
-                                if (
-                                    region in clone[0].regions
-                                    and bool(re.search(REGEX.preproduction_long, clone[0].full_name)) == False):
-                                        clone[0].cloneof = ''
-                                        clone[0].cloneof_group = ''
-                                        found_parent == True
-                                        preproduction_swap = clone[0]
-                                        break
+                            if (
+                                clone[0].features.regions != 0
+                                and bool(re.search(REGEX.preproduction_long, clone[0].full_name)) == False):
+                                    clone[0].cloneof = ''
+                                    clone[0].cloneof_group = ''
+                                    found_parent == True
+                                    preproduction_swap = clone[0]
                             if found_parent == True: break
 
                         for clone in clones:
@@ -21,11 +21,15 @@ def usage():
         print(f'{Font.bold}-q{Font.end}                   Disable dev mode (delete .dev file to')
         print(f'                     disable permanently)')
     print(f'{Font.bold}-o{Font.end} <output folder>   Set an output folder')
+    print(f'{Font.bold}-j{Font.end} <jobs>            Choose parents using a number of processes')
+    print(f'                     at once, to make use of more CPU cores.')
+    print(f'                     Folders process a dat file per process')
     print(f'{Font.bold}-x{Font.end}                   Export dat in legacy parent/clone format')
     print('                     (for use with Clonerel, not dat managers)')
     print(f'{Font.bold}-y{Font.end}                   Export a list of what titles have been')
     print(f'                     kept and removed in the output dat')
     print(f'{Font.bold}-v{Font.end}                   Verbose mode: report clone list errors')
+    print(f'{Font.bold}-z{Font.end}                   Cache processed dats to speed up later runs')
     print('\nFILTER OPTIONS:')
     print(f'{Font.bold}-l{Font.end}  Filter languages using a list (see {Font.bold}user-config.yaml{Font.end})')
     print(f'{Font.bold}-g{Font.end}  Enable most filters (-b -c -d -e -f -m -r -s)')
@@ -48,10 +52,10 @@ def check_input():
     user_options = []
 
     # Handle most user options
-    options = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'i', 'l', 'm', 'n', 'o', 'p', 'q', 'r', 's', 'u', 'v', 'x', 'y', 'z', '?']
+    options = ['a', 'b', 'c', 'd', 'e', 'f', 'g', 'i', 'j', 'l', 'm', 'n', 'o', 'p', 'q', 'r', 's', 'u', 'v', 'x', 'y', 'z', '?']
 
     # Remove these options from the output file name and other places
-    hide_options = ['g', 'i', 'l', 'o', 'q', 'v', 'y', 'z', '?']
+    hide_options = ['g', 'i', 'j', 'l', 'o', 'q', 'v', 'y', 'z', '?']
     non_g_options = ['a', 'n', 'p', 'u', 'x']
 
     for option in options:
@@ -76,6 +80,7 @@ def check_input():
     undo_dev = True if 'q' in user_options else False
     keep_remove = True if 'y' in user_options else False
     use_cache = True if 'z' in user_options else False
+    jobs = 1
 
     if user_options != []:
         # Set verbose and legacy to always be true if in dev environment
@@ -145,6 +150,18 @@ def check_input():
                             print(f'* Creating folder "{Font.bold}{output_folder_name}{Font.end}"')
                             os.makedirs(output_folder_name)
 
+        # Handle -j
+        if x == '-j':
+                # Handle invalid or empty input
+                if (
+                    i+1 == len(sys.argv)
+                    or sys.argv[i+1].isdigit() == False
+                    or int(sys.argv[i+1]) < 1):
+                    print(f'{Font.error}* -j needs a number of jobs above 0{Font.end}')
+                    error_state = True
+                else:
+                    jobs = int(sys.argv[i+1])
+
     # Check if no options have been provided
     if len(sys.argv) == 1:
         error_state = True
@@ -165,6 +182,11 @@ def check_input():
         print(f'{Font.error}* Can\'t have more than one -o{Font.end}')
         error_state = True
 
+    # Check if the user has entered more than one -j
+    if len([x for x in sys.argv if x=='-j']) > 1:
+        print(f'{Font.error}* Can\'t have more than one -j{Font.end}')
+        error_state = True
+
     # Set the ouput folder name if the user hasn't specified -o
     if len([x for x in sys.argv if x=='-o']) == 0:
             output_folder_name = os.path.abspath('.')
@@ -205,7 +227,8 @@ def check_input():
         user_options,
         verbose,
         keep_remove,
-        use_cache)
+        use_cache,
+        jobs)
 
 
 def import_user_config(region_data, user_input):
@@ -226,7 +249,34 @@ def import_user_config(region_data, user_input):
                     if language == key:
                         user_input.user_languages.append(value)
 
+            # Combine the filtered languages into a bitmask to compare titles against
+            user_input.user_language_bits = 0
+
+            for language in user_input.user_languages:
+                user_input.user_language_bits |= region_data.language_bits[language]
+
         elif 'region order' in entry:
             user_input.user_region_order = user_config[i]['region order'].data
 
+    # Add the other names of the user's regions after them, like No-Intro's "United
+    # Kingdom" for Redump's "UK". This is done once, so the region lists don't
+    # change while dat files are processed.
+    for region, aliases in region_data.aliases.items():
+        if region in user_input.user_region_order:
+            region_index = user_input.user_region_order.index(region)
+            user_input.user_region_order[region_index + 1:region_index + 1] = aliases
+            region_index = region_data.all.index(region)
+            region_data.all[region_index + 1:region_index + 1] = aliases
+            for alias in aliases:
+                region_data.implied_language[alias] = region_data.implied_language[region]
+
+    # Index every region, and rank the user's regions so the highest priority region
+    # has the highest rank. Titles' regions are compared by rank, rather than by
+    # walking the region lists.
+    region_data.priority = {region: i for i, region in enumerate(region_data.all)}
+    user_input.region_ranks = {}
+
+    for i, region in enumerate(user_input.user_region_order):
+        user_input.region_ranks.setdefault(region, len(user_input.user_region_order) - i)
+
     return user_input
\ No newline at end of file
@@ -13,6 +13,32 @@ def natural_keys(text):
     return [ atoi(c) for c in re.split(r'(\d+)', text) ]
 
 
+def hash_to_bytes(string):
+    """ Converts a hex hash to bytes. Hashes that aren't valid hex are kept as
+    lowercase text.
+    """
+
+    try:
+        hash_bytes = bytes.fromhex(string)
+    except ValueError:
+        return string.lower()
+
+    # bytes.fromhex skips whitespace, so make sure the hash converts back as-is
+    if hash_bytes.hex() != string.lower():
+        return string.lower()
+
+    return hash_bytes
+
+
+def hash_to_text(value):
+    """ Converts a hash stored by hash_to_bytes back to lowercase hex """
+
+    if isinstance(value, bytes):
+        return value.hex()
+
+    return value
+
+
 def printwrap(string, style=''):
     """ A wrapper for the textwrap function """
 
@@ -53,4 +79,83 @@ class Font:
     disabled = '\033[90m'
     bold = '\033[1m'
     underline = '\033[4m'
-    end = '\033[0m'
\ No newline at end of file
+    end = '\033[0m'
+
+
+def required_text(pattern):
+    """ Returns the longest run of text that every match of a tag regex must contain
+
+    Only literal characters outside of groups and character classes that aren't
+    made optional or repeated by a quantifier are counted. Returns an empty string
+    if there isn't any, or if the regex uses alternation or inline flags at the top
+    level.
+    """
+
+    runs = ['']
+    i = 0
+
+    def skip_to_end(i, opening, closing):
+        """ Returns the index after a group or character class ends """
+
+        depth = 0
+
+        while i < len(pattern):
+            if pattern[i] == '\\':
+                i += 2
+                continue
+            if pattern[i] == '[' and opening == '(':
+                i = skip_to_end(i, '[', ']')
+                continue
+            if pattern[i] == opening and (opening == '(' or depth == 0):
+                depth += 1
+            elif pattern[i] == closing:
+                depth -= 1
+                if depth == 0:
+                    return i + 1
+            i += 1
+
+        return i
+
+    while i < len(pattern):
+        character = pattern[i]
+        literal = ''
+
+        if character == '\\':
+            # Escaped punctuation is literal, escaped letters are character classes
+            if pattern[i + 1:i + 2].isalnum() == False:
+                literal = pattern[i + 1:i + 2]
+            i += 2
+        elif character == '[':
+            i = skip_to_end(i, '[', ']')
+        elif character == '(':
+            if re.match('\(\?[aiLmsux]', pattern[i:]) != None:
+                return ''
+            i = skip_to_end(i, '(', ')')
+        elif character == '|':
+            return ''
+        elif character in '*+?{':
+            # The previous character isn't required, or isn't contiguous with the
+            # next one
+            if runs[-1] != '' and previous_literal == True:
+                runs[-1] = runs[-1][:-1]
+            if character == '{':
+                i = pattern.find('}', i)
+            i += 1
+
+            # Skip lazy and possessive modifiers
+            if pattern[i:i + 1] in ['?', '+']:
+                i += 1
+        elif character in '.^$':
+            i += 1
+        else:
+            literal = character
+            i += 1
+
+        if literal != '':
+            runs[-1] += literal
+        else:
+            runs.append('')
+
+        previous_literal = literal != ''
+
+    return max(runs, key=len)
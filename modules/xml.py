@@ -1,112 +1,340 @@
 import datetime
-import functools
 import html
+import itertools
 import json
 import os
 import re
 import sys
 
 from lxml import etree
-from bs4 import BeautifulSoup
 
-from modules.classes import Dat, DatNode, DatNodeRom
-from modules.titleutils import choose_parent, get_raw_title
+from modules.classes import Dat, DatNode, DatNodeRom, DatTitle, TitleFeatures
+from modules.datfile import DAT_FILE_ERRORS, read_dat_lines
+from modules.parallel import choose_parents_in_pool
+from modules.titleutils import choose_parent, competing_groups, get_raw_title
 from modules.utils import Font, printverbose, printwrap
 
+# Added to Logiqx dats in place of their own DOCTYPE, so they're validated against
+# the local dtd while they're parsed
+DTD_DOCTYPE = '<!DOCTYPE datafile SYSTEM "datafile.dtd">'
 
-def convert_clrmame_dat(input_dat, is_folder):
-    """ Converts CLRMAMEPro dat format to LogiqX dat format """
+# Tags that aren't allowed in dats, and tags a Logiqx dat must have
+ABUSE_TAGS = ['<!ENTITY', '<!ELEMENT']
+VALIDATION_TAGS = ['<datafile>', '<?xml', '<game', '<header']
 
-    input_dat.contents = ''.join(input_dat.contents)
 
-    clrmame_header = re.search('^clrmamepro \($.*?^\)$', input_dat.contents, re.M|re.S)
+# Keys that can follow an unquoted rom name in a CLRMAMEPro dat
+CLRMAME_ROM_KEYS = ['size', 'crc', 'md5', 'sha1', 'sha256', 'serial', 'status', 'flags', 'date', 'mia']
 
-    def header_details(find_string, replace_string):
-        """ Gets values for CLRMAMEPro dat header details """
 
-        search_string = re.search(find_string, clrmame_header[0])
+def stream_clrmame_titles(dat_lines, header_details):
+    """ Streams the game blocks of a CLRMAMEPro dat into DatTitle records
 
-        if search_string != None:
-            return re.sub(
-                replace_string,
-                '',
-                search_string.group(0)).strip()
-        else:
-            return ''
-
-    dat_name = header_details(re.compile('.*?name.*'), 'name |(\")')
-    dat_description = header_details(
-        re.compile('.*?description.*'), 'description |(\")')
-    dat_category = header_details(re.compile('.*?category.*'), 'category |(\")')
-    dat_version = header_details(re.compile('.*?version.*'), 'version |(\")')
-    dat_author = header_details(re.compile('.*?author.*'), 'author |(\")')
-
-    convert_dat = []
-
-    convert_dat.append(
-        '<?xml version="1.0"?>\n\
-        <!DOCTYPE datafile PUBLIC "-//Logiqx//DTD ROM Management Datafile//EN" \
-            "http://www.logiqx.com/Dats/datafile.dtd"><datafile>\n\t<header>')
-    convert_dat.append(f'\t\t<name>{dat_name}</name>')
-    convert_dat.append(f'\t\t<description>{dat_description}</description>')
-    convert_dat.append(f'\t\t<version>{dat_version}</version>')
-    convert_dat.append(f'\t\t<author>{dat_author}</author>\n\t</header>')
-
-    # Now work through each of the title details
-    dat_contents = re.findall('^game \($.*?^\)$', input_dat.contents, re.M|re.S)
-    if dat_contents:
-        for item in dat_contents:
-            xml_node = re.split('\n', item)
-            regex = re.sub('name |(\")', '', xml_node[1].strip())
-            convert_dat.append(
-                f'\t<game name="{regex}">'
-                f'\n\t\t<category>{dat_category}</category>\n\t\t<description>'
-                f'{regex}</description>')
-            for node in xml_node:
-                if node.strip().startswith('rom'):
-                    node = node
-                    node = re.sub('^rom \( name ', '<rom name="', node.strip())
-                    node = re.sub(' size ', '" size="', node.strip())
-                    node = re.sub(' crc ', '" crc="', node.strip())
-                    node = re.sub(' md5 ', '" md5="', node.strip())
-                    node = re.sub(' sha1 ', '" sha1="', node.strip())
-                    node = re.sub(' \)$', '" />', node.strip())
-                    convert_dat.append('\t\t' + node)
-            convert_dat.append('\t</game>')
-        convert_dat.append('</datafile>')
-
-        convert_dat = '\n'.join(convert_dat)
-    else:
-        printwrap(
-            f'{Font.error_bold} * Error: {Font.error}file isn\'t Logiqx XML or '
-            f'CLRMAMEPro dat.{Font.end}', 'error')
-        if is_folder == False:
-            sys.exit()
-        else:
-            return 'end_batch'
-    return Dat(convert_dat, dat_name, dat_description, dat_version, dat_author)
+    The dat is tokenized a line at a time, so no intermediate LogiqX XML is made.
+    Header details are added to the header_details dict as they're found. As
+    with the previous conversion to LogiqX, titles take their category from the
+    dat header, and their description from their name.
+    """
+
+    blocks = []
+    category = ''
+
+    for line in dat_lines:
+        tokens = list(re.finditer('"[^"]*"|\\S+', line))
+        i = 0
+
+        while i < len(tokens):
+            key = tokens[i].group(0)
+            i += 1
+
+            # Close the current block
+            if key == ')':
+                if blocks == []:
+                    continue
+
+                block_name, fields = blocks.pop()
+
+                if blocks == []:
+                    if block_name == 'clrmamepro':
+                        category = fields.get('category', '')
+
+                        for detail in ['name', 'description', 'version', 'author']:
+                            if detail in fields and detail not in header_details:
+                                header_details[detail] = fields[detail]
+                    elif block_name == 'game':
+                        yield DatTitle(
+                            fields.get('name', ''),
+                            category,
+                            fields.get('name', ''),
+                            fields['roms'],
+                            fields['disk'])
+                elif blocks[-1][0] == 'game':
+                    if block_name == 'rom':
+                        blocks[-1][1]['roms'].append(
+                            DatNodeRom(
+                                'rom', fields.get('crc', ''), fields.get('md5', ''),
+                                fields.get('name', ''), fields.get('sha1', ''),
+                                fields.get('size')))
+                    elif block_name == 'disk':
+                        blocks[-1][1]['disk'] = True
+                continue
+
+            if i == len(tokens):
+                break
+
+            value = tokens[i]
+            i += 1
+
+            # Open a new block
+            if value.group(0) == '(':
+                blocks.append((key, {'roms': [], 'disk': False}))
+                continue
+
+            if blocks == []:
+                continue
+
+            if value.group(0).startswith('"'):
+                blocks[-1][1][key] = value.group(0)[1:-1]
+            elif (
+                key == 'name'
+                and blocks[-1][0] in ['rom', 'disk']):
+                # Unquoted rom names can contain spaces, so take everything up to
+                # the next rom key
+                name_end = value.end()
+
+                while (
+                    i < len(tokens)
+                    and tokens[i].group(0) not in CLRMAME_ROM_KEYS
+                    and tokens[i].group(0) != ')'):
+                        name_end = tokens[i].end()
+                        i += 1
+
+                blocks[-1][1][key] = line[value.start():name_end]
+            else:
+                blocks[-1][1][key] = value.group(0)
+
+
+class DtdResolver(etree.Resolver):
+    """ Resolves the DOCTYPE added to dats to the contents of the local Logiqx dtd """
+
+    def __init__(self, dtd):
+        self.dtd = dtd
 
+    def resolve(self, url, id, context):
+        return self.resolve_string(self.dtd, context)
 
-def dat_to_dict(region, region_data, input_dat, user_input, compilations_found, REGEX):
-    """ Converts an input dat file to a dict """
 
-    # Find all titles in the soup object that belong to the current region
-    if region == 'Unknown':
-        refined_region_xml = input_dat.soup.find_all(
-            'game', {'name': re.compile(
-                '^(?!.*(\(.*?(' + '|'.join(region_data.all).replace(
-                    '|Unknown','') + ').*?\))).*(.*)')})
+def stream_titles(dat_chunks, header_details, dtd=None):
+    """ Streams the <game> nodes of a LogiqX dat into DatTitle records
+
+    The dat is fed to the parser a chunk at a time, and each node is cleared from the
+    tree as soon as its record is made, so memory is bounded by the records rather
+    than the size of the XML. If the contents of a dtd are supplied, the dat is
+    validated against it in the same pass. Header details are added to the
+    header_details dict as they're found.
+    """
+
+    if dtd != None:
+        parser = etree.XMLPullParser(
+            events=('end',), tag=('header', 'game'), dtd_validation=True, no_network=True)
+        parser.resolvers.add(DtdResolver(dtd))
     else:
-        # Rough region selection first, as this speeds up processing larger files.
-        region_xml = input_dat.soup.find_all(
-            'game', {'name': lambda x: x and region in x})
+        parser = etree.XMLPullParser(events=('end',), tag=('header', 'game'))
+
+    def read_nodes():
+        for event, node in parser.read_events():
+            if node.tag == 'header':
+                for child in node:
+                    if isinstance(child.tag, str) and child.tag not in header_details:
+                        header_details[child.tag] = child.text
+            else:
+                yield title_record(node)
+
+            node.clear()
+            while node.getprevious() is not None:
+                del node.getparent()[0]
+
+    for chunk in dat_chunks:
+        parser.feed(chunk)
+        yield from read_nodes()
+
+    parser.close()
+    yield from read_nodes()
+
+
+def title_record(node):
+    """ Converts a <game> node to a DatTitle record """
+
+    roms = []
+
+    for rom in node.iterchildren('rom'):
+        roms.append(
+            DatNodeRom(
+                'rom', rom.get('crc', ''), rom.get('md5', ''), rom.get('name'),
+                rom.get('sha1', ''), rom.get('size')))
+
+    return DatTitle(
+        node.get('name'),
+        node.findtext('category', default=''),
+        node.findtext('description'),
+        roms,
+        node.find('disk') is not None)
+
+
+def prescan_dat(dat_lines, scan):
+    """ Checks and sanitizes the lines of a LogiqX dat in a single pass
+
+    Each line is checked for entity and element tags, and the tags a LogiqX dat
+    needs. Until the end of the header, the dat's DOCTYPE, CLRMAMEPro and
+    Romcenter declarations are removed, and its XML declaration points to the local
+    dtd. Lines are yielded as they're sanitized, and the results are added to the
+    scan dict. If a problem is found, the rest of the dat is scanned but not
+    yielded.
+    """
+
+    scan['abuse'] = False
+    scan['validation_tags'] = set()
+    scan['declaration_error'] = False
+
+    in_header = True
 
-        # Now refine the region selection
-        refined_region_xml = []
-        for node in region_xml:
-            if re.search('game.*?name=.*?\((.*?,){0,} {0,}' + region + '(,.*?){0,}\)', str(node)) != None:
-                refined_region_xml.append(node)
-        region_xml = None
+    for i, line in enumerate(dat_lines):
+        for abuse_tag in ABUSE_TAGS:
+            if abuse_tag in line:
+                scan['abuse'] = True
+
+        for validation_tag in VALIDATION_TAGS:
+            if validation_tag in line:
+                scan['validation_tags'].add(validation_tag)
+
+        if in_header == True:
+            sanitized_line = line
+
+            # Remove the dat's DOCTYPE, as the local dtd is referenced instead
+            if '<!DOCTYPE' in line and re.search('<!DOCTYPE.*?>', line) != None:
+                sanitized_line = re.sub('<!DOCTYPE.*?>', '', sanitized_line)
+
+            # Remove unexpected XML declarations from the file to avoid DTD check
+            # failures, and point the parser at the local dtd
+            if '<?xml' in line and re.search('<\?xml.*?>', line) != None:
+                declaration = re.search(
+                    '<\?xml.*?>', sanitized_line if i == 0 else first_line)
+
+                if declaration == None:
+                    scan['declaration_error'] = True
+                else:
+                    sanitized_line = sanitized_line.replace(
+                        declaration[0], f'<?xml version="1.0"?>{DTD_DOCTYPE}')
+
+            # Remove CLRMAMEPro and Romcenter declarations to avoid DTD check failures
+            if re.search('<(clrmamepro|romcenter).*?>', line) != None:
+                sanitized_line = ''
+
+            if '</header>' in line:
+                in_header = False
+
+            line = sanitized_line
+
+        if i == 0:
+            first_line = line
+
+        if scan['abuse'] == False and scan['declaration_error'] == False:
+            yield line
+
+
+def build_region_index(input_dat, region_data, REGEX):
+    """ Reads every title name in the dat once, and assigns the title to each region
+    it belongs to
+
+    Populates the following in the Dat object:
+
+    .region_index -- a dict of region names and the DatTitle records that belong to
+    them, in dat order
+    .claimed_titles -- the ids of records that have already been processed as part
+    of a region
+    .group_count -- how many groups parents have been chosen for
+    .trivial_group_count -- how many of those groups skipped parent selection, as
+    their titles don't compete
+    """
+
+    input_dat.region_index = {region: [] for region in region_data.all}
+    input_dat.region_index['Unknown'] = []
+    input_dat.claimed_titles = set()
+    input_dat.group_count = 0
+    input_dat.trivial_group_count = 0
+
+    regions = [region for region in input_dat.region_index if region != 'Unknown']
+
+    region_regexes = {region: REGEX.patterns.region(region) for region in regions}
+
+    unknown_regex = REGEX.patterns.get(
+        '^(?!.*(\(.*?(' + '|'.join(region_data.all).replace(
+            '|Unknown','') + ').*?\))).*(.*)')
+
+    for node in input_dat.titles:
+        # Rough region selection first, then refine it
+        candidates = [region for region in regions if region in node.name]
+
+        for region in candidates:
+            if region_regexes[region].search(node.name) != None:
+                input_dat.region_index[region].append(node)
+
+        # Titles without any region names in them have an unknown region
+        if candidates == [] or unknown_regex.search(node.name) != None:
+            input_dat.region_index['Unknown'].append(node)
+
+
+def build_title_nodes(input_dat, region_data, user_input, REGEX):
+    """ Creates a DatNode for every region each of the dat's titles belongs to, so
+    they can be cached and don't need to be created again when the dat is processed
+
+    Titles that can't be converted in a region are skipped here, and are converted
+    as normal if the user's region order calls for them.
+    """
+
+    for region, region_titles in input_dat.region_index.items():
+        for node in region_titles:
+            try:
+                node.nodes[region] = DatNode(
+                    node, region, region_data, user_input, input_dat, REGEX)
+            except (AttributeError, IndexError, KeyError, TypeError):
+                pass
+
+
+def is_filtered_language(disc_title, region_data, user_input, REGEX):
+    """ Returns whether a title should be removed because it doesn't have any of the
+    languages the user has filtered by
+
+    Titles from the "Unknown" region are always kept. Titles that don't list their
+    languages are kept if their region is assumed to have one of the languages.
+    """
+
+    if REGEX.patterns.languages(disc_title.languages) & user_input.user_language_bits != 0:
+        return False
+
+    # Handle regions with no languages specified
+    if disc_title.languages == '':
+        for region, language_bits in region_data.region_languages.items():
+            if (
+                region in disc_title.regions
+                and language_bits & user_input.user_language_bits != 0):
+                    return False
+
+    return 'Unknown' not in disc_title.regions
+
+
+def dat_to_dict(region, region_data, input_dat, user_input, compilations_found, REGEX, pool=None):
+    """ Converts an input dat file to a dict
+
+    If a pool of worker processes is given, the parents of each group are chosen
+    across the pool.
+    """
+
+    # Find all titles in the dat that belong to the current region, and haven't
+    # already been processed as part of another region
+    refined_region_xml = [
+        node for node in input_dat.region_index[region]
+        if id(node) not in input_dat.claimed_titles]
 
     progress = 0
     progress_old = 0
@@ -131,18 +359,17 @@ def dat_to_dict(region, region_data, input_dat, user_input, compilations_found,
         def exclude_categories(category, regexes=[]):
             if hasattr(user_input, 'no_' + category.lower()):
                 if getattr(user_input, 'no_' + category.lower()) == True:
-                    if node.category is not None:
-                        if node.category.contents[0] == category:
-                            if category not in user_input.removed_titles:
-                                user_input.removed_titles[category] = []
-                            user_input.removed_titles[category].append(node.description.parent['name'])
-                            return True
+                    if node.category == category:
+                        if category not in user_input.removed_titles:
+                            user_input.removed_titles[category] = []
+                        user_input.removed_titles[category].append(node.name)
+                        return True
                     if regexes != []:
                         for regex in regexes:
-                            if re.search(regex, node.description.parent['name']) != None:
+                            if re.search(regex, node.name) != None:
                                 if category not in user_input.removed_titles:
                                     user_input.removed_titles[category] = []
-                                user_input.removed_titles[category].append(node.description.parent['name'])
+                                user_input.removed_titles[category].append(node.name)
                                 return True
 
         if exclude_categories('Applications', REGEX.programs) == True: continue
@@ -161,128 +388,65 @@ def dat_to_dict(region, region_data, input_dat, user_input, compilations_found,
                 compilation_check = False
 
                 for compilation in input_dat.clone_lists.compilations:
-                    if compilation == node.description.parent['name']:
+                    if compilation == node.name:
                         compilation_check = True
                         compilations_found.update([compilation])
 
                 if compilation_check == True:
                     if 'Compilations' not in user_input.removed_titles:
                         user_input.removed_titles['Compilations'] = []
-                    user_input.removed_titles['Compilations'].append(node.description.parent['name'])
+                    user_input.removed_titles['Compilations'].append(node.name)
                     continue
 
-        # Drop XML nodes that don't have roms or disks specified
+        # Drop titles that don't have roms or disks specified
         if (
-            node.rom == None
-            and node.disk == None):
+            node.roms == []
+            and node.disk == False):
             continue
 
-        # Drop XML nodes that don't have at least one hash specified for roms
+        # Drop titles that don't have at least one hash specified for roms
         if (
-            'crc' not in str(node.rom)
-            and 'md5' not in str(node.rom)
-            and 'sha1' not in str(node.rom)
-        ):
+            node.roms == []
+            or (
+                node.roms[0].crc == b''
+                and node.roms[0].md5 == b''
+                and node.roms[0].sha1 == b'')):
             continue
 
         # Get the group name for the current node, then add it to the groups list
-        group_name = get_raw_title(node.description.parent['name'])
+        group_name = get_raw_title(node.name)
 
         if group_name not in groups:
             groups[group_name] = []
 
-        groups[group_name].append(
-            DatNode(node, region, region_data, user_input, input_dat, REGEX))
-
-        # Filter languages, if the option has been turned on
-        if user_input.filter_languages == True:
-            for disc_title in groups[group_name]:
-                language_found = False
-
-                for language in user_input.user_languages:
-                    if bool(re.search(language, disc_title.languages)) == True:
-                        language_found = True
-
-                    # Handle regions with no languages specified
-                    if disc_title.languages == '':
-                        # Handle the "Asia" region
-                        if (
-                            'Asia' in disc_title.regions
-                            and (
-                                language == region_data.languages_key['English']
-                                or language == region_data.languages_key['Chinese']
-                                or language == region_data.languages_key['Japanese']
-                            )):
-                                language_found = True
-                        # Handle Hong Kong and Taiwan
-                        elif (
-                            (
-                                'Hong Kong' in disc_title.regions
-                                or 'Taiwan' in disc_title.regions
-                            )
-                            and (
-                                language == region_data.languages_key['Chinese']
-                                or language == region_data.languages_key['English']
-                            )):
-                                language_found = True
-                        # Handle Latin America
-                        elif (
-                            'Latin America' in disc_title.regions
-                            and (
-                                language == region_data.languages_key['Spanish']
-                                or language == region_data.languages_key['Portuguese']
-                            )):
-                                language_found = True
-                        # Handle South Africa
-                        elif (
-                            'South Africa' in disc_title.regions
-                            and (
-                                language == region_data.languages_key['Afrikaans']
-                                or language == region_data.languages_key['English']
-                            )):
-                                language_found = True
-                        # Handle Switzerland
-                        elif (
-                            'Switzerland' in disc_title.regions
-                            and (
-                                language == region_data.languages_key['German']
-                                or language == region_data.languages_key['French']
-                                or language == region_data.languages_key['Italian']
-                            )):
-                                language_found = True
-                        # Handle Ukraine
-                        elif (
-                            'Ukraine' in disc_title.regions
-                            and (
-                                language == region_data.languages_key['Ukranian']
-                                or language == region_data.languages_key['Russian']
-                            )):
-                                language_found = True
-
-                if language_found == False and 'Unknown' not in disc_title.regions:
-                    if disc_title in groups[group_name]: groups[group_name].remove(disc_title)
-                    # Get the language name
-
-                    if 'Filtered languages' not in user_input.removed_titles:
-                        user_input.removed_titles['Filtered languages'] = []
-                    user_input.removed_titles['Filtered languages'].append(disc_title.full_name)
+        # Use the title's cached DatNode if there is one
+        if region in node.nodes:
+            disc_title = node.nodes[region]
+        else:
+            disc_title = DatNode(node, region, region_data, user_input, input_dat, REGEX)
+
+        # Filter languages, if the option has been turned on. Each title is only
+        # checked once, before it's added to its group.
+        if (
+            user_input.filter_languages == True
+            and is_filtered_language(disc_title, region_data, user_input, REGEX) == True):
+                if 'Filtered languages' not in user_input.removed_titles:
+                    user_input.removed_titles['Filtered languages'] = []
+                user_input.removed_titles['Filtered languages'].append(disc_title.full_name)
+        else:
+            groups[group_name].append(disc_title)
 
         progress_old = progress_percent
 
-    # Remove the nodes from the soup object so processing other regions is quicker.
-    print(
-            f'* Checking dat for titles in provided regions... {region} [Finishing up...]',
-            sep='', end='\r', flush=True
-        )
-    for node in refined_region_xml:
-        node.decompose()
+    # Claim the titles, so they aren't processed again as part of other regions
+    input_dat.claimed_titles.update(id(node) for node in refined_region_xml)
 
     # Process the overrides, which take them out of existing groups, put them into
     # others, and set fake shortnames
     if input_dat.clone_lists != None:
         if input_dat.clone_lists.overrides != None:
             for key, value in input_dat.clone_lists.overrides.items():
-                if re.search('\((.*?,){0,} {0,}' + region + '(,.*?){0,}\)', key) != None:
+                if REGEX.patterns.region(region).search(key) != None:
                     try:
                         titles_temp = groups[get_raw_title(key)].copy()
 
@@ -315,7 +479,7 @@ def dat_to_dict(region, region_data, input_dat, user_input, compilations_found,
         # same name but different content means a conditional override is required.
         if input_dat.clone_lists.conditional_overrides != None:
             for key, value in input_dat.clone_lists.conditional_overrides.items():
-                if re.search('\((.*?,){0,} {0,}' + region + '(,.*?){0,}\)', key) != None:
+                if REGEX.patterns.region(region).search(key) != None:
                     region_one = []
                     region_two = []
 
@@ -381,17 +545,28 @@ def dat_to_dict(region, region_data, input_dat, user_input, compilations_found,
                                     f'{Font.warning_bold}{key}{Font.end}')
 
     # Identify the parents for the region
+    if (
+        'Dreamcast' in input_dat.name
+        or 'Saturn' in input_dat.name
+        or 'Sega CD' in input_dat.name
+        or 'Panasonic - 3DO' in input_dat.name):
+        ring_code = True
+    else:
+        ring_code = False
+
     for group, titles in groups.items():
-        if (
-            'Dreamcast' in input_dat.name
-            or 'Saturn' in input_dat.name
-            or 'Sega CD' in input_dat.name
-            or 'Panasonic - 3DO' in input_dat.name):
-            ring_code = True
-        else:
-            ring_code = False
+        for title in titles:
+            if title.features == None:
+                title.features = TitleFeatures(title, REGEX, user_input)
 
-        titles = choose_parent(titles, region_data, user_input, REGEX, ring_code)
+    # Groups where the titles don't compete skip parent selection
+    competing = competing_groups(groups, input_dat, ring_code)
+
+    if pool == None:
+        for titles in competing:
+            titles = choose_parent(titles, region_data, user_input, REGEX, ring_code)
+    else:
+        choose_parents_in_pool(pool, user_input.jobs, competing, ring_code, REGEX)
 
     return groups
 
@@ -406,7 +581,7 @@ def process_input_dat(dat_file, is_folder):
     .version
     .author
     .url
-    .soup
+    .titles
 
     Removes the following from a Dat object:
 
@@ -418,107 +593,87 @@ def process_input_dat(dat_file, is_folder):
     else:
         next_status = ''
 
-    printwrap(f'* Reading dat file: "{Font.bold}{dat_file}{Font.end}"')
-    try:
-        with open(dat_file, 'r') as input_file:
-            print('* Validating dat file... ', sep=' ', end='', flush=True)
-            input_dat = Dat()
-            input_dat.contents = input_file.readlines()
-    except OSError as e:
+    def file_error(e):
+        """ Reports an error reading the dat file """
+
         printwrap(
             f'{Font.error_bold}* Error: {Font.error}{str(e)}.{Font.end}{next_status}',
             'error')
         if is_folder == False:
-            raise
+            raise e
         else:
             return 'end_batch'
 
-    # Check the dat file format -- if it's CLRMAMEPro format, convert it to LogiqX
-    if 'clrmamepro' in input_dat.contents[0]:
+    printwrap(f'* Reading dat file: "{Font.bold}{dat_file}{Font.end}"')
+    try:
+        dat_lines = read_dat_lines(dat_file)
+        first_line = next(dat_lines, '')
+        print('* Validating dat file... ', sep=' ', end='', flush=True)
+        input_dat = Dat()
+    except DAT_FILE_ERRORS as e:
+        return file_error(e)
+
+    dat_lines = itertools.chain([first_line], dat_lines)
+    header_details = {}
+
+    # Check the dat file format -- if it's CLRMAMEPro format, read it directly
+    if 'clrmamepro' in first_line:
         print('file is a CLRMAMEPro dat file.')
-        input_dat = convert_clrmame_dat(input_dat, is_folder)
 
-        # Go to the next file in a batch operation if something went wrong.
-        if input_dat == 'end_batch': return
-    else:
-        # Exit if there are entity or element tags to avoid abuse
-        abuse_tags = ['<!ENTITY', '<!ELEMENT']
-        for abuse_tag in abuse_tags:
-            if bool(list(filter(lambda x: abuse_tag in x, input_dat.contents))) == True:
-                print('failed.')
-                printwrap(
-                    f'{Font.error_bold} Error: {Font.error}Entity and element tags '
-                    f'aren\'t supported in dat files.{Font.end}{next_status}', 'error')
-                sys.exit()
+        try:
+            input_dat.titles = list(stream_clrmame_titles(dat_lines, header_details))
+        except DAT_FILE_ERRORS as e:
+            return file_error(e)
 
-        # Check for a valid Redump XML dat that follows the Logiqx dtd
-        validation_tags = ['<datafile>', '<?xml', '<game', '<header']
+        if input_dat.titles == []:
+            printwrap(
+                f'{Font.error_bold} * Error: {Font.error}file isn\'t Logiqx XML or '
+                f'CLRMAMEPro dat.{Font.end}', 'error')
+            if is_folder == False:
+                sys.exit()
+            else:
+                return 'end_batch'
+    else:
+        try:
+            with open('datafile.dtd') as dtdfile:
+                dtd = dtdfile.read()
+        except OSError as e:
+            printwrap(f'{Font.error_bold}* Error: {str(e)}{next_status}{Font.end}',
+                      'error')
+            if is_folder == False:
+                raise
+            else:
+                return 'end_batch'
 
-        for i, validation_tag in enumerate(validation_tags):
-            validation_tags[i] = bool(list(filter(lambda x: validation_tag in x, input_dat.contents)))
-            continue
+        # Scan, sanitize, validate, and read the titles from the dat in one pass
+        scan = {}
+        dat_lines = prescan_dat(dat_lines, scan)
+        parse_error = None
 
-        if functools.reduce(lambda a,b: a + b, validation_tags) == len(validation_tags):
+        try:
             try:
-                for i, line in enumerate(input_dat.contents):
-                    # Remove unexpected XML declarations from the file to avoid DTD check failures
-                    if bool(re.search('<\?xml.*?>', line)) == True:
-                        input_dat.contents[i] = input_dat.contents[i].replace(re.search('<\?xml.*?>', input_dat.contents[0])[0], '<?xml version="1.0"?>')
-                    # Remove CLRMAMEPro and Romcenter declarations to avoid DTD check failures
-                    if bool(re.search('.*?<(clrmamepro|romcenter).*?>', line)) == True:
-                        input_dat.contents[i] = ''
-                    if bool(re.search('.*?</header>', line)) == True:
-                        break
-            except:
-                print('failed.')
-                printwrap(
-                    f'{Font.error_bold}* Error: {Font.error}File is missing an XML '
-                    f'declaration. It\'s probably not a dat file.'
-                    f'{next_status}{Font.end}', 'error')
-                if is_folder == False:
-                    sys.exit()
-                else:
-                    return 'end_batch'
+                input_dat.titles = list(stream_titles(dat_lines, header_details, dtd))
+            except etree.XMLSyntaxError as e:
+                parse_error = e
+
+            # Finish the scan if the parser stopped early, so problems are reported
+            # in the same order as if the whole dat was checked first
+            for line in dat_lines:
+                pass
+        except DAT_FILE_ERRORS as e:
+            print('failed.')
+            return file_error(e)
 
-            input_dat.contents = ''.join(input_dat.contents)
+        # Exit if there are entity or element tags to avoid abuse
+        if scan['abuse'] == True:
+            print('failed.')
+            printwrap(
+                f'{Font.error_bold} Error: {Font.error}Entity and element tags '
+                f'aren\'t supported in dat files.{Font.end}{next_status}', 'error')
+            sys.exit()
 
-            try:
-                with open('datafile.dtd') as dtdfile:
-                    dtd = etree.DTD(dtdfile)
-                    try:
-                        root = etree.XML(input_dat.contents)
-
-                        if dtd.validate(root) == False:
-                            print('failed.')
-                            printwrap(
-                                f'{Font.error_bold}* Error: {Font.error}XML file '
-                                f'doesn\'t conform to Logiqx dtd. '
-                                f'{dtd.error_log.last_error}.'
-                                f'{next_status}{Font.end}', 'error')
-                            if is_folder == False:
-                                sys.exit()
-                            else:
-                                return 'end_batch'
-                    except etree.XMLSyntaxError as e:
-                        print('failed.')
-                        printwrap(
-                            f'{Font.error_bold}* Error: {Font.error}XML file is '
-                            f'malformed. {e}.{next_status}{Font.end}', 'error')
-                        if is_folder == False:
-                            sys.exit()
-                        else:
-                            return 'end_batch'
-                    else:
-                        print('file is a Logiqx dat file.')
-
-            except OSError as e:
-                printwrap(f'{Font.error_bold}* Error: {str(e)}{next_status}{Font.end}',
-                          'error')
-                if is_folder == False:
-                    raise
-                else:
-                    return 'end_batch'
-        else:
+        # Check for a valid Redump XML dat that follows the Logiqx dtd
+        if len(scan['validation_tags']) != len(VALIDATION_TAGS):
             print('failed.')
             printwrap(
                 f'{Font.error_bold}* Error: "{dat_file}"{Font.error} '
@@ -528,21 +683,48 @@ def process_input_dat(dat_file, is_folder):
             else:
                 return 'end_batch'
 
-    # Convert contents to BeautifulSoup object, remove original contents attribute
-    print('* Converting dat file to a searchable format... ', sep=' ', end='', flush=True)
-    input_dat.soup = BeautifulSoup(input_dat.contents, "lxml-xml")
+        if scan['declaration_error'] == True:
+            print('failed.')
+            printwrap(
+                f'{Font.error_bold}* Error: {Font.error}File is missing an XML '
+                f'declaration. It\'s probably not a dat file.'
+                f'{next_status}{Font.end}', 'error')
+            if is_folder == False:
+                sys.exit()
+            else:
+                return 'end_batch'
+
+        if parse_error != None:
+            print('failed.')
+            if parse_error.error_log.last_error.domain == etree.ErrorDomains.VALID:
+                printwrap(
+                    f'{Font.error_bold}* Error: {Font.error}XML file '
+                    f'doesn\'t conform to Logiqx dtd. '
+                    f'{parse_error}.'
+                    f'{next_status}{Font.end}', 'error')
+            else:
+                printwrap(
+                    f'{Font.error_bold}* Error: {Font.error}XML file is '
+                    f'malformed. {parse_error}.{next_status}{Font.end}', 'error')
+            if is_folder == False:
+                sys.exit()
+            else:
+                return 'end_batch'
+
+        print('file is a Logiqx dat file.')
+
+    # Remove original contents attribute
     del input_dat.contents
-    print('done.')
 
     # Set input dat header details
-    if input_dat.soup.find('header') != None:
+    if header_details != {}:
         for key, value in input_dat.__dict__.items():
             if (
-                key != 'soup'
+                key != 'titles'
                 and key != 'user_options'
                 and value == 'Unknown'
-                and input_dat.soup.find(key) != None):
-                setattr(input_dat, key, input_dat.soup.find(key).string)
+                and key in header_details):
+                setattr(input_dat, key, header_details[key])
             elif value == '':
                 setattr(input_dat, key, 'Unknown')
 
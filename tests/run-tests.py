@@ -0,0 +1,289 @@
+#!/usr/bin/env python
+
+""" run-tests.py: Tests Retool's parent selection against the dats in the tests/dats
+folder.
+
+Run with python tests/run-tests.py. The default user-config.yaml region order is
+used. Other Redump or No-Intro dats can be copied to the tests/dats folder to check
+the parent engines against them too.
+"""
+
+import contextlib
+import glob
+import io
+import os
+import random
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+import zipfile
+
+# How many times each group's titles are shuffled when comparing the parent engines
+SHUFFLES = 3
+
+# Run from Retool's folder, so its config files are found
+RETOOL_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DAT_FOLDER = os.path.join(RETOOL_FOLDER, 'tests', 'dats')
+
+os.chdir(RETOOL_FOLDER)
+sys.path.insert(0, RETOOL_FOLDER)
+
+from modules.classes import Patterns, Regex, RegionKeys, Runtime, TagKeys, Titles, UserInput
+from modules.importdata import build_clone_lists, build_regions, build_tags, import_metadata
+from modules.titleutils import assign_clones, choose_cross_region_parents, choose_parent_pairwise,\
+    choose_parent_ranked, get_group_tags, get_region_bits
+from modules.userinput import import_user_config
+from modules.xml import build_region_index, dat_to_dict, process_input_dat
+from retool import PRIORITY_REGIONS
+
+
+def build_runtime():
+    """ Builds the region data, user input, and regexes the way retool.py does,
+    with no options set
+    """
+
+    region_data = build_regions(RegionKeys())
+    REGEX = Regex(region_data.languages_short)
+
+    user_input = UserInput(
+        '', '', False, False, False, False, False, False, False, False, False, False,
+        False, False, False, False, '', False, False, False, 1)
+
+    user_input = import_user_config(region_data, user_input)
+    REGEX.patterns = Patterns(region_data)
+    user_input.tag_strings = build_tags(TagKeys())
+
+    return Runtime(region_data, user_input, REGEX)
+
+
+def choose_dat_parents(dat_file, runtime):
+    """ Chooses the parents in a dat file the way process_dat does, and returns the
+    Dat and Titles objects
+    """
+
+    runtime = runtime.for_dat()
+    region_data = runtime.region_data
+    user_input = runtime.user_input
+    REGEX = runtime.REGEX
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        input_dat = process_input_dat(dat_file, False)
+        input_dat.clone_lists = build_clone_lists(input_dat)
+        input_dat.metadata = import_metadata(input_dat.name)
+
+        build_region_index(input_dat, region_data, REGEX)
+
+        processing_region_order = [
+            x for x in user_input.user_region_order if x in PRIORITY_REGIONS]
+        processing_region_order.extend(
+            [x for x in user_input.user_region_order if x not in PRIORITY_REGIONS and x != 'Unknown'])
+        if 'Unknown' in user_input.user_region_order:
+            processing_region_order.append('Unknown')
+
+        titles = Titles()
+
+        for region in processing_region_order:
+            titles.regions[region] = dat_to_dict(
+                region, region_data, input_dat, user_input, set(), REGEX)
+
+        choose_cross_region_parents(titles, input_dat, user_input, REGEX)
+
+        if input_dat.clone_lists != None:
+            assign_clones(titles, input_dat, region_data, user_input, REGEX)
+
+    return input_dat, titles
+
+
+def is_ring_code_dat(input_dat):
+    """ Returns whether a dat's titles are compared by ring code, the same way as
+    dat_to_dict
+    """
+
+    return (
+        'Dreamcast' in input_dat.name
+        or 'Saturn' in input_dat.name
+        or 'Sega CD' in input_dat.name
+        or 'Panasonic - 3DO' in input_dat.name)
+
+
+def find_title(titles, full_name):
+    """ Returns the DatNode with a full name from a Titles object """
+
+    for group in titles.all.values():
+        for title in group:
+            if title.full_name == full_name:
+                return title
+
+
+class TestRegions(unittest.TestCase):
+    """ Tests that titles' regions are ranked in the user's region order """
+
+    @classmethod
+    def setUpClass(cls):
+        cls.runtime = build_runtime()
+        cls.input_dat, cls.titles = choose_dat_parents(
+            os.path.join(DAT_FOLDER, 'Nintendo - Game Boy Advance.dat'), cls.runtime)
+
+    def test_region_bits_with_tag_before_regions(self):
+        """ A tag before the region tag is included in a title's regions, which
+        shouldn't stop the first region from being ranked
+        """
+
+        region_ranks = self.runtime.user_input.region_ranks
+
+        self.assertEqual(
+            get_region_bits('2001) (Canada, Italy', region_ranks),
+            get_region_bits('Canada, Italy', region_ranks))
+
+        self.assertNotEqual(
+            get_region_bits('2001) (Canada, Italy', region_ranks)
+            & 1 << (region_ranks['Canada'] - 1), 0)
+
+    def test_cross_region_parent_with_tag_before_regions(self):
+        """ Titles with a tag before their region tag are parents if their first
+        region is the user's highest priority region
+        """
+
+        for parent, clone in [
+            (
+                'Diddy Kong Pilot (2001) (Canada, Italy) (Nl+En)',
+                'Diddy Kong Pilot (2001) (Latin America, France)'),
+            (
+                'Yoshi Sample (SDK 3.0) (Australia, Germany)',
+                'Yoshi Sample (SDK 3.0) (Korea, Brazil)')]:
+                    self.assertEqual(find_title(self.titles, parent).cloneof, '')
+                    self.assertEqual(find_title(self.titles, clone).cloneof, parent)
+
+
+class TestParentEngines(unittest.TestCase):
+    """ Tests that choose_parent_ranked picks the same parents as
+    choose_parent_pairwise in every group in the test dats
+    """
+
+    def test_ranked_matches_pairwise(self):
+        """ Runs both engines on each group with more than one title, in dat order
+        and shuffled. Groups that choose_parent_ranked can't rank fall back to
+        choose_parent_pairwise, and aren't compared.
+        """
+
+        runtime = build_runtime()
+        region_data = runtime.region_data
+        user_input = runtime.user_input
+        REGEX = runtime.REGEX
+
+        ranked_count = 0
+
+        for dat_file in sorted(glob.glob(os.path.join(DAT_FOLDER, '*.dat'))):
+            input_dat, titles = choose_dat_parents(dat_file, runtime)
+            ring_code = is_ring_code_dat(input_dat)
+
+            for region, groups in titles.regions.items():
+                for group, group_titles in groups.items():
+                    if len(group_titles) < 2:
+                        continue
+
+                    for i in range(SHUFFLES + 1):
+                        if i == 0:
+                            order = group_titles
+                        else:
+                            order = random.Random(i).sample(group_titles, len(group_titles))
+
+                        tags = get_group_tags(order)
+
+                        ranked = choose_parent_ranked(
+                            order, tags, region_data, user_input, REGEX, ring_code)
+
+                        if ranked == None:
+                            continue
+
+                        ranked_count += 1
+
+                        pairwise = choose_parent_pairwise(
+                            order, tags, region_data, user_input, REGEX, ring_code)
+
+                        with self.subTest(dat=input_dat.name, region=region, group=group, shuffle=i):
+                            self.assertEqual(
+                                [x.full_name for x in ranked], [x.full_name for x in pairwise])
+
+        # Make sure the engines were compared at all
+        self.assertGreater(ranked_count, 0)
+
+
+def read_output_folder(output_folder):
+    """ Returns the names and contents of the files in an output folder, without the
+    time Retool wrote them
+    """
+
+    output = {}
+
+    for file_name in os.listdir(output_folder):
+        with open(os.path.join(output_folder, file_name)) as output_file:
+            output[re.sub(' \\(Retool .*?\\)', '', file_name)] = output_file.read()
+
+    return output
+
+
+class TestPool(unittest.TestCase):
+    """ Tests that processing a folder across a pool of processes writes the same
+    output dats as processing it one file at a time
+    """
+
+    def setUp(self):
+        self.folder = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.folder)
+
+    def run_retool(self, input_file, jobs):
+        """ Runs Retool on a file with a number of jobs, and returns the contents of
+        its output folder
+        """
+
+        output_folder = os.path.join(self.folder, f'output-{jobs}')
+        os.makedirs(output_folder)
+
+        subprocess.run(
+            [sys.executable, 'retool.py', '-i', input_file, '-o', output_folder, '-j', str(jobs)],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        return read_output_folder(output_folder)
+
+    def test_exit_stops_later_files(self):
+        """ A large dat with an entity tag stops Retool before the valid dat after
+        it, even though the valid dat finishes first in the pool
+
+        The dats are stored in a zip file, so they're processed in a known order.
+        """
+
+        with open(os.path.join(DAT_FOLDER, 'Nintendo - Game Boy Advance.dat')) as dat_file:
+            valid_dat = dat_file.read()
+
+        # Make the dat with the entity tag the largest, so it's started first and
+        # takes the longest
+        padding = ''.join([
+            f'\t<game name="Padding {i} (USA)">\n'
+            f'\t\t<description>Padding {i} (USA)</description>\n'
+            f'\t\t<rom name="Padding {i} (USA).bin" size="1" crc="{i:08x}" sha1="{i:040x}"/>\n'
+            f'\t</game>\n' for i in range(50000)])
+
+        abuse_dat = valid_dat.replace(
+            '<datafile>', '<!ENTITY abuse "abuse">\n<datafile>', 1).replace(
+            '</datafile>', padding + '</datafile>', 1)
+
+        input_file = os.path.join(self.folder, 'dats.zip')
+
+        with zipfile.ZipFile(input_file, 'w', zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr('Abuse.dat', abuse_dat)
+            archive.writestr('Nintendo - Game Boy Advance.dat', valid_dat)
+
+        serial_output = self.run_retool(input_file, 1)
+
+        self.assertEqual(serial_output, {})
+        self.assertEqual(self.run_retool(input_file, 2), serial_output)
+
+
+if __name__ == '__main__':
+    unittest.main()